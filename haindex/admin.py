@@ -7,7 +7,7 @@ from haindex import models
 
 def repository_update(modeladmin, request, queryset):
     for item in queryset:
-        item.update()
+        item.update(force=True)
 
 
 repository_update.short_description = _('Update repositories from GitHub')
@@ -21,3 +21,8 @@ class RepositoryAdmin(admin.ModelAdmin):
 @admin.register(models.RepositoryRelease)
 class RepositoryReleaseAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(models.WebhookDelivery)
+class WebhookDeliveryAdmin(admin.ModelAdmin):
+    pass
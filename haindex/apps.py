@@ -7,3 +7,6 @@ from django.apps import AppConfig
 class HAIndexConfig(AppConfig):
     name = 'haindex'
     verbose_name = 'Home Assistant Index'
+
+    def ready(self):
+        from haindex import signals  # noqa
@@ -15,4 +15,20 @@ app.conf.CELERYBEAT_SCHEDULE.update({
         'task': 'haindex.tasks.fan_out_update_repository_tasks',
         'schedule': crontab(day_of_month='*', hour=3, minute=0),
     },
+    'process_webhook_deliveries': {
+        'task': 'haindex.tasks.process_webhook_deliveries',
+        'schedule': crontab(minute='*'),
+    },
+    'flush_search_index_queue': {
+        'task': 'haindex.tasks.flush_search_index_queue',
+        'schedule': crontab(minute='*'),
+    },
+    'update_extension_counters': {
+        'task': 'haindex.tasks.update_extension_counters',
+        'schedule': crontab(minute=30),
+    },
+    'update_repository_stats': {
+        'task': 'haindex.tasks.update_all_repository_stats',
+        'schedule': crontab(day_of_month='*', hour=1, minute=0),
+    },
 })
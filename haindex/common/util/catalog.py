@@ -0,0 +1,56 @@
+# -*- coding: UTF-8 -*-
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat
+
+from haindex.common.util.counters import get_counter, increment_counter
+from haindex.documents import RepositoryDocument
+from haindex.models import Repository
+
+VERSION_COUNTER = 'catalog:version'
+
+
+def get_catalog_version():
+    """
+    get the version of the extension catalog
+    """
+    return get_counter(VERSION_COUNTER)
+
+
+def bump_catalog_version():
+    """
+    start a new catalog version once the current transaction is committed
+    """
+    transaction.on_commit(lambda: increment_counter(VERSION_COUNTER))
+
+
+def iter_catalog(chunk_size=500):
+    """
+    stream all imported extensions as dicts with a server side cursor, without creating model instances
+    """
+    queryset = Repository.objects.filter(last_import__isnull=False).annotate(
+        username=F('user__username'),
+        dependency_names=ArrayAgg(
+            Concat('dependencies__user__username', Value('/'), 'dependencies__name'),
+            filter=Q(dependencies__isnull=False), ordering=('dependencies__user__username', 'dependencies__name')),
+    ).order_by('id').values('username', 'dependency_names', *Repository.CATALOG_FIELDS)
+
+    for values in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            'name': '{}/{}'.format(values['username'], values['name']),
+            'display_name': values['display_name'],
+            'description': values['description'],
+            'type': RepositoryDocument.TYPE_NAMES.get(values['type']),
+            'keywords': values['keywords'] or [],
+            'author': {
+                'name': values['author_name'],
+                'homepage': values['author_homepage'],
+            },
+            'license': values['license'],
+            'files': values['files'] or [],
+            'has_package_file': values['has_package_file'],
+            'dependencies': values['dependency_names'] or [],
+            'last_commit_id': values['last_commit_id'],
+            'last_push': values['last_push'],
+        }
@@ -0,0 +1,83 @@
+# -*- coding: UTF-8 -*-
+import logging
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from haindex.models import Counter, ExtensionCounter, Repository
+
+logger = logging.getLogger(__name__)
+
+
+def change_extension_count(type, delta):
+    """
+    change the counter of an extension type once the current transaction is committed
+    """
+    if type is None or not delta:
+        return
+
+    def update():
+        updated = ExtensionCounter.objects.filter(type=type).update(count=F('count') + delta)
+        if not updated:
+            # first extension of this type, count all of them
+            reconcile_extension_counters()
+
+    transaction.on_commit(update)
+
+
+def get_extension_counts():
+    """
+    get the number of repositories by extension type
+    """
+    return dict(ExtensionCounter.objects.values_list('type', 'count'))
+
+
+def reconcile_extension_counters():
+    """
+    overwrite the counters with the actual number of repositories, returns the types that were wrong
+
+    counter updates run after the repository change is committed, so a change committed just before the count whose
+    update is still waiting for the counter lock is counted twice. the next reconciliation corrects it
+    """
+    corrected = []
+    with transaction.atomic():
+        # lock the counters first, changes committed after the count are added to the stored count afterwards
+        counters = {counter.type: counter for counter in ExtensionCounter.objects.select_for_update()}
+        totals = {
+            total['type']: total['total']
+            for total in Repository.objects.filter(type__isnull=False).values('type').annotate(total=Count('id'))
+        }
+        for type_id, _ in Repository.TYPE_CHOICES:
+            counter = counters.get(type_id)
+            if counter is None:
+                ExtensionCounter.objects.create(type=type_id, count=totals.get(type_id, 0))
+            elif counter.count != totals.get(type_id, 0):
+                corrected.append(type_id)
+                logger.warning('Extension counter of type %s was %d instead of %d', type_id, counter.count,
+                               totals.get(type_id, 0))
+                counter.count = totals.get(type_id, 0)
+                counter.save(update_fields=['count'])
+    return corrected
+
+
+def increment_counter(name, delta=1):
+    """
+    atomically change a named counter, creating it on first use
+    """
+    if Counter.objects.filter(name=name).update(value=F('value') + delta):
+        return
+    Counter.objects.bulk_create([Counter(name=name)], ignore_conflicts=True)
+    Counter.objects.filter(name=name).update(value=F('value') + delta)
+
+
+def get_counter(name, default=0):
+    value = Counter.objects.filter(name=name).values_list('value', flat=True).first()
+    return default if value is None else value
+
+
+def set_counter(name, value):
+    Counter.objects.update_or_create(name=name, defaults={'value': value})
+
+
+def reset_counters(*names):
+    Counter.objects.filter(name__in=names).update(value=0)
@@ -0,0 +1,124 @@
+# -*- coding: UTF-8 -*-
+import logging
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from haindex.models import Repository, RepositoryDependencyPath
+
+logger = logging.getLogger(__name__)
+
+
+class DependencyGraph(object):
+    """
+    maintain the transitive closure of repository dependencies
+    """
+    VISITING = 1
+    DONE = 2
+
+    def update(self, repository_id):
+        """
+        recompute the closure of a repository and of all repositories depending on it
+        """
+        ancestor_ids = set(RepositoryDependencyPath.objects.filter(
+            descendant_id=repository_id).values_list('ancestor_id', flat=True))
+        self._rebuild(ancestor_ids | {repository_id})
+
+    def remove(self, repository):
+        """
+        delete a repository and update the closure of all repositories depending on it
+        """
+        ancestor_ids = set(RepositoryDependencyPath.objects.filter(
+            descendant_id=repository.id).values_list('ancestor_id', flat=True))
+        repository.delete()
+        self._rebuild(ancestor_ids - {repository.id})
+
+    def rebuild_all(self):
+        self._rebuild(set(Repository.objects.values_list('id', flat=True)))
+
+    def _rebuild(self, repository_ids):
+        if not repository_ids:
+            return
+
+        edges = self._load_edges(repository_ids)
+        with transaction.atomic():
+            # remember former descendants to update their dependents count
+            descendant_ids = set(RepositoryDependencyPath.objects.filter(
+                ancestor_id__in=repository_ids).values_list('descendant_id', flat=True))
+            RepositoryDependencyPath.objects.filter(ancestor_id__in=repository_ids).delete()
+
+            paths = []
+            cyclic_ids = set()
+            for repository_id in repository_ids:
+                depths, cyclic = self._get_depths(repository_id, edges)
+                if cyclic:
+                    cyclic_ids.add(repository_id)
+                for descendant_id, depth in depths.items():
+                    if descendant_id != repository_id:
+                        paths.append(RepositoryDependencyPath(
+                            ancestor_id=repository_id, descendant_id=descendant_id, depth=depth))
+                        descendant_ids.add(descendant_id)
+            RepositoryDependencyPath.objects.bulk_create(paths, batch_size=1000)
+
+            if cyclic_ids:
+                logger.warning('Dependency cycle detected for repositories %s', sorted(cyclic_ids))
+            Repository.objects.filter(id__in=cyclic_ids).update(has_dependency_cycle=True)
+            Repository.objects.filter(id__in=repository_ids - cyclic_ids).update(has_dependency_cycle=False)
+
+            # update reverse dependency counts
+            dependents = RepositoryDependencyPath.objects.filter(descendant_id=OuterRef('pk')).order_by().values(
+                'descendant_id').annotate(total=Count('id')).values('total')
+            Repository.objects.filter(id__in=descendant_ids).update(
+                dependents_count=Coalesce(Subquery(dependents), Value(0)))
+
+    def _load_edges(self, repository_ids):
+        """
+        load all direct dependencies reachable from the given repositories, level by level
+        """
+        through = Repository.dependencies.through
+        edges = dict()
+        loaded = set()
+        frontier = set(repository_ids)
+        while frontier:
+            for from_id, to_id in through.objects.filter(from_repository_id__in=frontier).values_list(
+                    'from_repository_id', 'to_repository_id'):
+                edges.setdefault(from_id, set()).add(to_id)
+            loaded |= frontier
+            frontier = {to_id for from_id in frontier for to_id in edges.get(from_id, ())} - loaded
+        return edges
+
+    def _get_depths(self, root, edges):
+        """
+        get the longest path from root to every reachable repository, edges closing a cycle are ignored
+
+        returns the depths by repository id and whether a cycle was found
+        """
+        # sort reachable repositories topologically with an iterative depth first search
+        cyclic = False
+        order = []
+        state = {root: self.VISITING}
+        stack = [(root, iter(sorted(edges.get(root, ()))))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if state.get(child) == self.VISITING:
+                    cyclic = True
+                elif child not in state:
+                    state[child] = self.VISITING
+                    stack.append((child, iter(sorted(edges.get(child, ())))))
+                    break
+            else:
+                stack.pop()
+                state[node] = self.DONE
+                order.append(node)
+        order.reverse()
+
+        # relax edges in topological order
+        position = {node: index for index, node in enumerate(order)}
+        depths = {root: 0}
+        for node in order:
+            for child in edges.get(node, ()):
+                if position[child] > position[node]:
+                    depths[child] = max(depths.get(child, 0), depths[node] + 1)
+        return depths, cyclic
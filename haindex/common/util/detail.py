@@ -0,0 +1,24 @@
+# -*- coding: UTF-8 -*-
+from django.utils import timezone
+
+from haindex.models import Repository
+
+
+def touch_repository_details(repository_ids):
+    """
+    invalidate conditional requests and cached fragments of repository detail pages
+
+    changes that are not reflected in the modified or last import timestamps of a repository
+    (stats, releases, forks, dependents) must touch the affected pages
+    """
+    repository_ids = [repository_id for repository_id in repository_ids if repository_id]
+    if repository_ids:
+        Repository.objects.filter(id__in=repository_ids).update(detail_changed=timezone.now())
+
+
+def get_repository_detail_modified(modified, last_import, detail_changed):
+    """
+    get the last change of a repository detail page
+    """
+    timestamps = [value for value in (modified, last_import, detail_changed) if value is not None]
+    return max(timestamps) if timestamps else None
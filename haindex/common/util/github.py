@@ -0,0 +1,207 @@
+# -*- coding: UTF-8 -*-
+import hashlib
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache, caches
+from github import Github
+from github.Requester import Requester, HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass
+
+from haindex.common.util import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'github:response:{hash}'
+METRIC_CACHE_HIT = 'github_cache_hit'
+METRIC_CACHE_MISS = 'github_cache_miss'
+
+_local = threading.local()
+
+
+class RateLimitExhausted(Exception):
+    def __init__(self, reset, *args, **kwargs):
+        self.reset = reset
+        super().__init__('GitHub rate limit exhausted until {}'.format(reset), *args, **kwargs)
+
+    @property
+    def countdown(self):
+        return max(int(self.reset - time.time()), 0) + 1
+
+
+class TokenPool(object):
+    """
+    process-shared rate limit accounting of the configured GitHub API tokens
+    """
+    STATE_KEY = 'github:ratelimit:{resource}:{hash}'
+    DEFAULT_LIMIT = 5000
+    DEFAULT_RESET = 60 * 60
+
+    def get_tokens(self):
+        tokens = list(settings.GITHUB_API_TOKENS)
+        if settings.GITHUB_API_TOKEN and settings.GITHUB_API_TOKEN not in tokens:
+            tokens.append(settings.GITHUB_API_TOKEN)
+        return tokens
+
+    def _get_key(self, token, resource):
+        return self.STATE_KEY.format(resource=resource, hash=hashlib.sha1(token.encode('UTF-8')).hexdigest())
+
+    def get_remaining(self, token, resource='core'):
+        state = cache.get(self._get_key(token, resource))
+        if state is None or state['reset'] <= time.time():
+            return self.DEFAULT_LIMIT, None
+        return state['remaining'], state['reset']
+
+    def record(self, token, headers, resource=None):
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+        resource = resource or headers.get('X-RateLimit-Resource', 'core')
+        cache.set(self._get_key(token, resource), {'remaining': int(remaining), 'reset': int(reset)},
+                  timeout=max(int(reset) - int(time.time()), 0) + 60)
+
+    def get_token(self, tokens=None, resource='core'):
+        """
+        pick the token with the most headroom, raise RateLimitExhausted if all of them are used up
+
+        returns None for unauthenticated requests if no token is configured at all
+        """
+        tokens = tokens or self.get_tokens()
+        if not tokens:
+            logger.error('No GitHub API token configured, sending unauthenticated requests')
+            return None
+
+        best_token, best_remaining, earliest_reset = None, 0, None
+        for token in tokens:
+            remaining, reset = self.get_remaining(token, resource=resource)
+            if remaining > max(settings.GITHUB_RATE_LIMIT_RESERVE, best_remaining):
+                best_token, best_remaining = token, remaining
+            elif reset is not None and (earliest_reset is None or reset < earliest_reset):
+                earliest_reset = reset
+
+        if best_token is None:
+            raise RateLimitExhausted(reset=earliest_reset or time.time() + self.DEFAULT_RESET)
+        return best_token
+
+    def get_reset(self, resource='core'):
+        resets = [self.get_remaining(token, resource=resource)[1] for token in self.get_tokens()]
+        resets = [reset for reset in resets if reset is not None]
+        return min(resets) if resets else time.time() + self.DEFAULT_RESET
+
+
+def get_session():
+    """
+    share one requests session per thread to keep connections alive
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+class CachedResponse(object):
+    # mimic the httplib response object
+    def __init__(self, status, headers, text):
+        self.status = status
+        self.headers = headers
+        self.text = text
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self):
+        return self.text
+
+
+class ConditionalHTTPSConnectionClass(HTTPSRequestsConnectionClass):
+    """
+    https connection sending conditional requests for previously seen GET responses
+
+    responses are cached by url and authorization, a 304 reply is served from cache
+    and doesn't count against the rate limit
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session = get_session()
+
+    def _get_cache_key(self):
+        authorization = (self.headers or {}).get('Authorization', '')
+        digest = hashlib.sha1('{} {}'.format(authorization, self.url).encode('UTF-8')).hexdigest()
+        return CACHE_KEY.format(hash=digest)
+
+    def _record_rate_limit(self, response):
+        authorization = (self.headers or {}).get('Authorization', '')
+        scheme, _, token = authorization.partition(' ')
+        if scheme.lower() in ('token', 'bearer') and token:
+            TokenPool().record(token, response.headers)
+
+    def getresponse(self):
+        if self.verb.upper() != 'GET':
+            response = super().getresponse()
+            self._record_rate_limit(response)
+            return response
+
+        response_cache = caches[settings.GITHUB_CACHE]
+        cache_key = self._get_cache_key()
+        cached = response_cache.get(cache_key)
+
+        # send validators of the cached response
+        if cached:
+            self.headers = dict(self.headers or {})
+            if cached.get('etag'):
+                self.headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                self.headers['If-Modified-Since'] = cached['last_modified']
+
+        response = super().getresponse()
+        self._record_rate_limit(response)
+
+        # serve unchanged content from cache, keep fresh rate limit headers
+        if cached and response.status == 304:
+            metrics.increment(METRIC_CACHE_HIT)
+            headers = dict(cached['headers'])
+            headers.update(response.headers)
+            return CachedResponse(status=200, headers=headers, text=cached['text'])
+
+        metrics.increment(METRIC_CACHE_MISS)
+        if response.status == 200:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if etag or last_modified:
+                response_cache.set(cache_key, {
+                    'etag': etag,
+                    'last_modified': last_modified,
+                    'headers': dict(response.headers),
+                    'text': response.text,
+                }, timeout=settings.GITHUB_CACHE_TIMEOUT)
+
+        return response
+
+
+Requester.injectConnectionClasses(HTTPRequestsConnectionClass, ConditionalHTTPSConnectionClass)
+
+
+def get_client(login_or_token=None, password=None):
+    return Github(login_or_token=login_or_token, password=password)
+
+
+def get_pooled_client(tokens=None):
+    """
+    get a client authenticated with the pool token with the most headroom
+    """
+    return get_client(login_or_token=TokenPool().get_token(tokens=tokens))
+
+
+def get_cache_stats():
+    return {
+        'hits': metrics.get(METRIC_CACHE_HIT),
+        'misses': metrics.get(METRIC_CACHE_MISS),
+    }
+
+
+def reset_cache_stats():
+    metrics.reset(METRIC_CACHE_HIT, METRIC_CACHE_MISS)
@@ -0,0 +1,293 @@
+# -*- coding: UTF-8 -*-
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVector
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Func, OuterRef, Q, Subquery, TextField, Value
+from django.utils import timezone
+from elasticsearch.exceptions import ElasticsearchException
+from elasticsearch.helpers import bulk, parallel_bulk
+from elasticsearch_dsl.connections import connections
+
+from haindex.common.util.counters import get_counter, set_counter
+from haindex.common.util.search import BACKEND_ELASTICSEARCH, DatabaseSearchResultList, bump_generation
+from haindex.documents import INDEX_NAME, INDEX_SETTINGS, RepositoryDocument, search_index
+from haindex.models import Repository, SearchIndexQueue
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SCHEDULED_KEY = 'haindex:search:flush:scheduled'
+REINDEX_COUNTER = 'search:reindex:started'
+
+
+def queue_index_update(repository_ids):
+    """
+    queue repositories for the next bulk index update
+    """
+    if not repository_ids:
+        return
+    SearchIndexQueue.objects.bulk_create([
+        SearchIndexQueue(repository_id=repository_id) for repository_id in repository_ids
+    ], ignore_conflicts=True)
+
+    def schedule_flush():
+        if cache.add(FLUSH_SCHEDULED_KEY, True, timeout=settings.SEARCH_INDEX_FLUSH_DELAY):
+            try:
+                from haindex.tasks import flush_search_index_queue
+                flush_search_index_queue.apply_async(countdown=settings.SEARCH_INDEX_FLUSH_DELAY)
+            except Exception as e:
+                # the periodic flush will pick it up
+                logger.exception(e)
+
+    transaction.on_commit(schedule_flush)
+
+
+def get_search_vector():
+    """
+    weighted full text search vector of a repository for the database search backend
+    """
+    config = DatabaseSearchResultList.SEARCH_CONFIG
+    username = Subquery(get_user_model().objects.filter(pk=OuterRef('user_id')).values('username')[:1])
+    keywords = Func(F('keywords'), Value(' '), function='array_to_string', output_field=TextField())
+    readme = Func(F('readme'), Value('<[^>]*>'), Value(' '), Value('g'), function='regexp_replace',
+                  output_field=TextField())
+    return (
+        SearchVector('name', username, weight='A', config=config) +
+        SearchVector(keywords, weight='B', config=config) +
+        SearchVector('author_name', 'description', weight='C', config=config) +
+        SearchVector(readme, weight='D', config=config)
+    )
+
+
+def update_search_vectors(repository_ids=None):
+    """
+    update the search vectors of the given or all repositories with a single statement
+    """
+    queryset = Repository.objects.all()
+    if repository_ids is not None:
+        queryset = queryset.filter(id__in=repository_ids)
+    return queryset.update(search_vector=get_search_vector())
+
+
+def is_reindexing():
+    """
+    whether a new search index is being built, queued updates are held back until its alias is swapped
+    """
+    return get_counter(REINDEX_COUNTER) > time.time() - settings.SEARCH_REINDEX_TIMEOUT
+
+
+def get_bulk_action(index, op_type, repository_id, source=None):
+    action = {
+        '_op_type': op_type,
+        '_index': index,
+        '_type': RepositoryDocument._doc_type.name,
+        '_id': repository_id,
+    }
+    if source is not None:
+        action['_source'] = source
+    return action
+
+
+class SearchIndexer(object):
+    """
+    write queued repositories to the search index with bulk requests
+
+    repositories the index rejects are retried with a growing delay and dropped after MAX_ATTEMPTS,
+    so a single broken document doesn't hold up the queue
+    """
+    BATCH_SIZE = 500
+    MAX_ATTEMPTS = 5
+    RETRY_DELAY = 60
+
+    def __init__(self, batch_size=None, *args, **kwargs):
+        self.batch_size = batch_size or self.BATCH_SIZE
+        super().__init__(*args, **kwargs)
+
+    def flush(self):
+        """
+        flush one batch of the queue, returns the number of processed entries
+        """
+        if is_reindexing():
+            return 0
+
+        with transaction.atomic():
+            entries = list(SearchIndexQueue.objects.select_for_update(skip_locked=True).filter(
+                Q(retry_after__isnull=True) | Q(retry_after__lte=timezone.now())).order_by('id')[:self.batch_size])
+            if not entries:
+                return 0
+            repository_ids = {entry.repository_id for entry in entries}
+
+            # the database search vectors are always maintained to fall back on
+            update_search_vectors(repository_ids)
+
+            failed_ids = set()
+            if settings.SEARCH_BACKEND == BACKEND_ELASTICSEARCH:
+                try:
+                    failed_ids = self._update_index(repository_ids)
+                except ElasticsearchException as e:
+                    # keep the queue entries for the next flush, search vectors are stored nevertheless
+                    logger.warning('Search index update failed: %s', e)
+                    entries = []
+
+            SearchIndexQueue.objects.filter(id__in=[
+                entry.id for entry in entries if entry.repository_id not in failed_ids
+            ]).delete()
+            self._retry_later([entry for entry in entries if entry.repository_id in failed_ids])
+
+        bump_generation()
+
+        return len(entries)
+
+    def _retry_later(self, entries):
+        for entry in entries:
+            entry.attempts += 1
+            if entry.attempts >= self.MAX_ATTEMPTS:
+                logger.error('Dropped repository %d from the search index queue after %d attempts',
+                             entry.repository_id, entry.attempts)
+                entry.delete()
+                continue
+            entry.retry_after = timezone.now() + timedelta(seconds=self.RETRY_DELAY * 2 ** (entry.attempts - 1))
+            entry.save(update_fields=['attempts', 'retry_after'])
+
+    def _update_index(self, repository_ids):
+        """
+        index existing and remove deleted repositories, returns the ids of rejected repositories
+        """
+        index = RepositoryDocument._doc_type.index
+        document = RepositoryDocument()
+        failed_ids = set()
+        actions = []
+        for repository in Repository.objects.filter(id__in=repository_ids).select_related('user'):
+            try:
+                actions.append(get_bulk_action(index, 'index', repository.id, document.prepare(repository)))
+            except Exception as e:
+                logger.exception(e)
+                failed_ids.add(repository.id)
+
+        existing_ids = {action['_id'] for action in actions} | failed_ids
+        actions.extend(get_bulk_action(index, 'delete', repository_id)
+                       for repository_id in repository_ids - existing_ids)
+        if not actions:
+            return failed_ids
+
+        # refresh so the next search generation sees the changes
+        success, errors = bulk(connections.get_connection(), actions, raise_on_error=False, refresh=True)
+        for error in errors:
+            op_type, info = error.popitem()
+            # documents of deleted repositories may have never been indexed
+            if op_type == 'delete' and info.get('status') == 404:
+                continue
+            logger.warning('Search index rejected repository %s: %s', info.get('_id'), info.get('error'))
+            failed_ids.add(int(info['_id']))
+        return failed_ids
+
+    def flush_all(self):
+        processed = 0
+        while True:
+            count = self.flush()
+            if not count:
+                break
+            processed += count
+        return processed
+
+
+class SearchReindexer(object):
+    """
+    build a new versioned search index in parallel and swap the index alias once it is complete
+
+    searches keep using the current index while the new one is built, queued index updates are held back
+    and replayed into the new index before the swap
+    """
+    CHUNK_SIZE = 500
+
+    def __init__(self, workers=None, chunk_size=None, alias=INDEX_NAME, *args, **kwargs):
+        self.workers = workers or settings.SEARCH_REINDEX_WORKERS
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.alias = alias
+        self.client = connections.get_connection()
+        self.document = RepositoryDocument()
+        super().__init__(*args, **kwargs)
+
+    def reindex(self):
+        """
+        returns the name of the new index and the number of indexed repositories
+        """
+        name = '{alias}-{timestamp}'.format(alias=self.alias, timestamp=int(time.time()))
+        index = search_index.clone(name=name)
+
+        # refreshes and replicas are only needed after the bulk load
+        index.create()
+        self.client.indices.put_settings(index=name, body={
+            'index': {'refresh_interval': '-1', 'number_of_replicas': 0},
+        })
+
+        # changes committed from now on stay in the queue instead of going to the current index only
+        set_counter(REINDEX_COUNTER, int(time.time()))
+        try:
+            indexed_ids = self._index(name, self.document.get_queryset())
+            self._replay_queue(name)
+
+            self.client.indices.put_settings(index=name, body={
+                'index': {
+                    'refresh_interval': '1s',
+                    'number_of_replicas': INDEX_SETTINGS['number_of_replicas'],
+                },
+            })
+            self.client.indices.refresh(index=name)
+
+            self._swap_alias(name)
+        finally:
+            set_counter(REINDEX_COUNTER, 0)
+
+        # the next flush writes the queue to the new index once more, including changes queued during the swap
+        bump_generation()
+        return name, len(indexed_ids)
+
+    def _replay_queue(self, name):
+        queued_ids = set(SearchIndexQueue.objects.values_list('repository_id', flat=True))
+        if not queued_ids:
+            return
+        indexed_ids = self._index(name, self.document.get_queryset().filter(id__in=queued_ids))
+        deleted_ids = queued_ids - indexed_ids
+        if deleted_ids:
+            bulk(self.client, [
+                get_bulk_action(name, 'delete', repository_id) for repository_id in deleted_ids
+            ], raise_on_error=False)
+
+    def _index(self, index, queryset):
+        indexed_ids = set()
+
+        def actions():
+            for repository in queryset.iterator(chunk_size=self.chunk_size):
+                indexed_ids.add(repository.id)
+                yield get_bulk_action(index, 'index', repository.id, self.document.prepare(repository))
+
+        # documents are prepared while the worker threads send the bulk requests
+        for success, info in parallel_bulk(self.client, actions(), thread_count=self.workers,
+                                           chunk_size=self.chunk_size, raise_on_error=False):
+            if not success:
+                logger.warning('Failed to index repository: %s', info)
+        return indexed_ids
+
+    def _swap_alias(self, name):
+        actions = [{'add': {'index': name, 'alias': self.alias}}]
+        if self.client.indices.exists_alias(name=self.alias):
+            old_indices = list(self.client.indices.get_alias(name=self.alias).keys())
+            actions.extend({'remove': {'index': old_index, 'alias': self.alias}} for old_index in old_indices)
+        else:
+            old_indices = []
+            if self.client.indices.exists(index=self.alias):
+                # a concrete index of the alias name is dropped in the same request that creates the alias
+                logger.warning('Replacing index %s with an alias', self.alias)
+                actions.append({'remove_index': {'index': self.alias}})
+
+        # move the alias in a single atomic request
+        self.client.indices.update_aliases(body={'actions': actions})
+
+        for old_index in old_indices:
+            self.client.indices.delete(index=old_index)
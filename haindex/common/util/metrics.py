@@ -0,0 +1,79 @@
+# -*- coding: UTF-8 -*-
+import atexit
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+
+from haindex.common.util.counters import get_counter, increment_counter, reset_counters
+
+METRIC_KEY = 'metric:{name}'
+
+# counts of this process that are not written to the database yet
+_pending = Counter()
+_lock = threading.Lock()
+_last_flush = time.time()
+
+
+def increment(name, delta=1):
+    """
+    count in process, the counts are added to the database at most once per METRICS_FLUSH_INTERVAL
+    """
+    with _lock:
+        _pending[name] += delta
+    if time.time() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def flush():
+    """
+    add the counts of this process to the database counters, returns the number of flushed metrics
+    """
+    global _last_flush
+
+    # a counter row locked by an open transaction would block every other process until it is committed
+    if transaction.get_connection().in_atomic_block:
+        return 0
+
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.time()
+    for name, delta in pending.items():
+        if delta:
+            increment_counter(METRIC_KEY.format(name=name), delta)
+    return len(pending)
+
+
+def get(name):
+    """
+    get the count of all processes, counts of the last METRICS_FLUSH_INTERVAL may be missing
+    """
+    return get_counter(METRIC_KEY.format(name=name))
+
+
+def format_cache_stats(hits, misses):
+    """
+    format the hit and miss counts of a cache together with its hit ratio
+    """
+    total = hits + misses
+    ratio = hits / total * 100 if total else 0
+    return 'hits: {hits}\nmisses: {misses}\nhit ratio: {ratio:.1f}%'.format(hits=hits, misses=misses, ratio=ratio)
+
+
+def reset(*names):
+    with _lock:
+        for name in names:
+            _pending.pop(name, None)
+    reset_counters(*[METRIC_KEY.format(name=name) for name in names])
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        flush()
+    except Exception:
+        # the database may be gone already
+        pass
@@ -0,0 +1,133 @@
+# -*- coding: UTF-8 -*-
+import base64
+import json
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.expressions import RawSQL
+from django.utils.dateparse import parse_datetime
+
+COUNT_KEY = 'haindex:pagination:count:{key}'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage(object):
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, *args, **kwargs):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        super().__init__(*args, **kwargs)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class LastPushPaginator(object):
+    """
+    paginate repositories by (last push, id) descending with opaque cursors
+
+    repositories without push sort as pushed at -infinity, so every page is a single range scan
+    of the (COALESCE(last_push, '-infinity'), id) index, regardless of how deep it is
+    """
+    PUSH_KEY = 'COALESCE("{table}"."last_push", \'-infinity\'::timestamptz)'
+    PUSH_KEY_NULL = '-infinity'
+
+    def __init__(self, queryset, page_size, *args, **kwargs):
+        self.push_key = self.PUSH_KEY.format(table=queryset.model._meta.db_table)
+        self.queryset = queryset.order_by(RawSQL(self.push_key, ()).desc(), '-id')
+        self.page_size = page_size
+        super().__init__(*args, **kwargs)
+
+    @staticmethod
+    def encode_cursor(repository, direction):
+        value = json.dumps([direction, repository.last_push.isoformat() if repository.last_push else None,
+                            repository.id])
+        return base64.urlsafe_b64encode(value.encode('utf-8')).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            direction, last_push, id = json.loads(
+                base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+            if last_push is not None:
+                last_push = parse_datetime(last_push)
+                if last_push is None:
+                    raise ValueError(cursor)
+        except (ValueError, TypeError):
+            raise InvalidCursor(cursor)
+        if direction not in ('next', 'previous') or not isinstance(id, int):
+            raise InvalidCursor(cursor)
+        return direction, last_push, id
+
+    def get_page(self, cursor=None):
+        if not cursor:
+            return self._get_next_page(None, None, first=True)
+        direction, last_push, id = self.decode_cursor(cursor)
+        if direction == 'next':
+            return self._get_next_page(last_push, id)
+        return self._get_previous_page(last_push, id)
+
+    def get_cursor_at(self, offset):
+        """
+        get the cursor of the page starting at an offset, for links to former numbered pages
+        """
+        if offset <= 0:
+            return None
+        object_list = list(self.queryset[offset - 1:offset])
+        if not object_list:
+            raise InvalidCursor(offset)
+        return self.encode_cursor(object_list[0], 'next')
+
+    def _filter(self, queryset, operator, last_push, id):
+        # a row comparison, unlike its expansion into OR conditions, is a single index range
+        return queryset.extra(where=['({push_key}, "{table}"."id") {operator} (%s, %s)'.format(
+            push_key=self.push_key, table=queryset.model._meta.db_table, operator=operator,
+        )], params=[self.PUSH_KEY_NULL if last_push is None else last_push, id])
+
+    def _get_next_page(self, last_push, id, first=False):
+        queryset = self.queryset
+        if not first:
+            queryset = self._filter(queryset, '<', last_push, id)
+
+        object_list = list(queryset[:self.page_size + 1])
+        has_next = len(object_list) > self.page_size
+        object_list = object_list[:self.page_size]
+        return KeysetPage(
+            object_list,
+            next_cursor=self.encode_cursor(object_list[-1], 'next') if has_next else None,
+            previous_cursor=self.encode_cursor(object_list[0], 'previous') if object_list and not first else None,
+        )
+
+    def _get_previous_page(self, last_push, id):
+        # rows before (last_push, id) in reverse order
+        queryset = self._filter(self.queryset.reverse(), '>', last_push, id)
+
+        object_list = list(queryset[:self.page_size + 1])
+        has_previous = len(object_list) > self.page_size
+        object_list = list(reversed(object_list[:self.page_size]))
+        return KeysetPage(
+            object_list,
+            next_cursor=self.encode_cursor(object_list[-1], 'next') if object_list else None,
+            previous_cursor=self.encode_cursor(object_list[0], 'previous') if has_previous else None,
+        )
+
+    def count(self, key=''):
+        """
+        get the number of rows, cached for a while as exact numbers don't matter for browsing
+        """
+        cache_key = COUNT_KEY.format(key=sha1(key.encode('utf-8')).hexdigest())
+        total = cache.get(cache_key)
+        if total is None:
+            total = self.queryset.order_by().count()
+            cache.set(cache_key, total, timeout=settings.PAGINATION_COUNT_TIMEOUT)
+        return total
@@ -0,0 +1,41 @@
+# -*- coding: UTF-8 -*-
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+
+class QueryCounter(object):
+    """
+    count the sql queries and their total duration on all database connections
+
+    usage:
+        with QueryCounter() as counter:
+            ...
+        counter.count, counter.duration
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.count = 0
+        self.duration = 0.0
+        self._stack = None
+        super().__init__(*args, **kwargs)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stack.close()
+        self._stack = None
+        return False
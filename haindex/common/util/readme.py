@@ -1,5 +1,40 @@
 # -*- coding: UTF-8 -*-
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.cache import caches
 from readme_renderer import markdown, rst, txt
+from readme_renderer.__about__ import __version__ as renderer_version
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+
+
+def get_pool():
+    """
+    get the process pool used to render readmes, None if rendering should happen inline
+    """
+    global _pool
+    if _pool is None and settings.README_RENDER_PROCESSES > 0:
+        _pool = ProcessPoolExecutor(max_workers=settings.README_RENDER_PROCESSES)
+    return _pool
+
+
+def reset_pool():
+    """
+    drop a broken process pool, the next render starts a new one
+    """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+        _pool = None
+
+
+def render_html(content, extension=None):
+    return ReadmeRenderer().get_html(content=content, extension=extension)
 
 
 class ReadmeRenderer(object):
@@ -9,6 +44,8 @@ class ReadmeRenderer(object):
         '.rst': rst,
         '.md': markdown,
     }
+    CACHE_KEY = 'readme:html:{version}:{sha}:{extension}'
+    CACHE_TIMEOUT = 60 * 60 * 24 * 30
 
     def get_html(self, content, extension=None):
         # get renderer for file extension
@@ -22,3 +59,51 @@ class ReadmeRenderer(object):
             rendered = txt.render(content)
 
         return rendered
+
+    def render(self, sha, load_content, extension=None):
+        """
+        start rendering a readme blob, content is only loaded if the blob hasn't been rendered before
+        """
+        cache_key = self.CACHE_KEY.format(version=renderer_version, sha=sha, extension=extension)
+        html = caches[settings.GITHUB_CACHE].get(cache_key)
+        if html is not None:
+            return ReadmeRenderJob(cache_key=cache_key, html=html)
+
+        content = load_content()
+        pool = get_pool()
+        if pool:
+            try:
+                return ReadmeRenderJob(cache_key=cache_key, future=pool.submit(render_html, content, extension),
+                                       content=content, extension=extension)
+            except Exception as e:
+                # e.g. daemonic celery worker processes can't have children
+                logger.warning('Failed to render readme in process pool: %s', e)
+
+        return ReadmeRenderJob(cache_key=cache_key, html=self.get_html(content=content, extension=extension),
+                               cached=False)
+
+
+class ReadmeRenderJob(object):
+    def __init__(self, cache_key, html=None, future=None, cached=True, content=None, extension=None):
+        self.cache_key = cache_key
+        self.html = html
+        self.future = future
+        self.content = content
+        self.extension = extension
+        self.cached = cached and future is None
+        super().__init__()
+
+    def get_html(self):
+        if self.html is None:
+            try:
+                self.html = self.future.result()
+            except Exception as e:
+                # a crashed worker breaks the whole pool, render this one inline
+                logger.warning('Failed to render readme in process pool, rendering inline: %s', e)
+                if isinstance(e, BrokenProcessPool):
+                    reset_pool()
+                self.html = render_html(self.content, self.extension)
+        if not self.cached:
+            caches[settings.GITHUB_CACHE].set(self.cache_key, self.html, timeout=ReadmeRenderer.CACHE_TIMEOUT)
+            self.cached = True
+        return self.html
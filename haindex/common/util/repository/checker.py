@@ -7,16 +7,18 @@ from pathlib import Path
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext_lazy as _
-from github import Github, UnknownObjectException, GithubException
+from github import UnknownObjectException, GithubException
 import yaml
 import jsonschema
 
+from haindex.common.util.github import get_client
+
 logger = logging.getLogger(__name__)
 
 
 class RepositoryChecker(object):
     def __init__(self, access_token, github_user, github_repo, *args, **kwargs):
-        self.client = Github(login_or_token=access_token)
+        self.client = get_client(login_or_token=access_token)
         self.github_user = github_user
         self.github_repo = github_repo
         self.repo = None
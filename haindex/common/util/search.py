@@ -0,0 +1,439 @@
+# -*- coding: UTF-8 -*-
+import json
+import logging
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from hashlib import sha1
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.core.cache import cache, caches
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+from django.utils.translation import ugettext_lazy as _
+from elasticsearch.exceptions import ElasticsearchException
+
+from haindex.common.util import metrics
+from haindex.common.util.counters import get_counter, increment_counter
+from haindex.documents import RepositoryDocument
+from haindex.models import Repository
+
+logger = logging.getLogger(__name__)
+
+BACKEND_ELASTICSEARCH = 'elasticsearch'
+BACKEND_POSTGRES = 'postgres'
+
+GENERATION_COUNTER = 'search:generation'
+RESULT_KEY = 'haindex:search:result:{generation}:{backend}:{key}:{start}:{stop}'
+ELASTICSEARCH_DOWN_KEY = 'haindex:search:elasticsearch:down'
+METRIC_CACHE_HIT = 'search_cache_hit'
+METRIC_CACHE_MISS = 'search_cache_miss'
+
+# the generation last read by this process and when it was read
+_generation = None
+_generation_read = 0
+
+
+def get_generation():
+    """
+    get the search index generation, cached results of older generations are never read again
+
+    the generation is read from the database at most once per SEARCH_GENERATION_INTERVAL,
+    searches may return results of the former generation for that long after an index update
+    """
+    global _generation, _generation_read
+    if _generation is None or time.time() - _generation_read >= settings.SEARCH_GENERATION_INTERVAL:
+        _generation, _generation_read = get_counter(GENERATION_COUNTER), time.time()
+    return _generation
+
+
+def bump_generation():
+    """
+    invalidate all cached search results, must be called after every write to the search index
+    """
+    global _generation
+    increment_counter(GENERATION_COUNTER)
+    _generation = None
+
+
+def is_elasticsearch_available():
+    return settings.SEARCH_BACKEND == BACKEND_ELASTICSEARCH and not cache.get(ELASTICSEARCH_DOWN_KEY)
+
+
+def normalize_term(term):
+    return ' '.join(term.lower().split())
+
+
+def get_cache_stats():
+    return {
+        'hits': metrics.get(METRIC_CACHE_HIT),
+        'misses': metrics.get(METRIC_CACHE_MISS),
+    }
+
+
+def reset_cache_stats():
+    metrics.reset(METRIC_CACHE_HIT, METRIC_CACHE_MISS)
+
+
+class SearchResult(object):
+    """
+    search result built from the stored fields of a search hit, provides the attributes used by the templates
+    """
+    TYPE_DISPLAY = {
+        RepositoryDocument.TYPE_NAMES[type_id]: display for type_id, display in Repository.TYPE_CHOICES
+    }
+
+    def __init__(self, id, username, name, type=None, description='', last_push=None, highlight=None):
+        self.id = id
+        self.username = username
+        self.name = name
+        self.type = type
+        self.description = description
+        self.last_push = last_push
+        self.highlight = highlight
+        super().__init__()
+
+    def get_type_display(self):
+        return self.TYPE_DISPLAY.get(self.type, '')
+
+    @classmethod
+    def from_hit(cls, hit):
+        highlight = getattr(hit.meta, 'highlight', None)
+        return cls(
+            id=int(hit.meta.id),
+            username=hit.username,
+            name=hit.name,
+            type=getattr(hit, 'type', None),
+            description=getattr(hit, 'description', ''),
+            last_push=getattr(hit, 'last_push', None),
+            highlight=' … '.join(highlight.description) if highlight and 'description' in highlight else None,
+        )
+
+    @classmethod
+    def from_values(cls, values):
+        return cls(
+            id=values['id'],
+            username=values['user__username'],
+            name=values['name'],
+            type=RepositoryDocument.TYPE_NAMES.get(values['type']),
+            description=values['description'],
+            last_push=values['last_push'],
+        )
+
+
+class Facet(object):
+    """
+    search filter by a keyword field of the index, counts are computed with a terms aggregation
+
+    db_values maps index values to database values if they differ
+    """
+
+    def __init__(self, name, field, label, size=10, labels=None, db_values=None, multiple=False):
+        self.name = name
+        self.field = field
+        self.label = label
+        self.size = size
+        self.labels = labels or dict()
+        self.db_values = db_values
+        self.multiple = multiple
+        super().__init__()
+
+    def get_label(self, value):
+        return self.labels.get(value, value)
+
+    def get_db_values(self, values):
+        if self.db_values is None:
+            return values
+        return [self.db_values[value] for value in values if value in self.db_values]
+
+    def get_index_value(self, db_value):
+        if self.db_values is None:
+            return db_value
+        return {value: key for key, value in self.db_values.items()}.get(db_value)
+
+    def filter_queryset(self, queryset, values):
+        if self.multiple:
+            return queryset.filter(**{self.field + '__overlap': self.get_db_values(values)})
+        return queryset.filter(**{self.field + '__in': self.get_db_values(values)})
+
+
+FACETS = [
+    Facet('type', 'type', _('Extension type'), labels=SearchResult.TYPE_DISPLAY, db_values={
+        name: type_id for type_id, name in RepositoryDocument.TYPE_NAMES.items()
+    }),
+    Facet('user_type', 'user_type', _('Owner type'), labels={
+        RepositoryDocument.USER_TYPE_NAMES[type_id]: display for type_id, display in Repository.USER_TYPE_CHOICES
+    }, db_values={
+        name: type_id for type_id, name in RepositoryDocument.USER_TYPE_NAMES.items()
+    }),
+    Facet('license', 'license', _('License')),
+    Facet('keyword', 'keywords', _('Keyword'), size=20, multiple=True),
+]
+
+
+def get_facet_filters(query_dict):
+    """
+    get the selected facet values from request parameters
+    """
+    filters = dict()
+    for facet in FACETS:
+        values = sorted({value for value in query_dict.getlist(facet.name) if value})
+        if values:
+            filters[facet.name] = values
+    return filters
+
+
+def filter_repositories(queryset, filters):
+    """
+    apply selected facets to a repository queryset
+    """
+    for facet in FACETS:
+        if facet.name in filters:
+            queryset = facet.filter_queryset(queryset, filters[facet.name])
+    return queryset
+
+
+class BaseSearchResultList(ABC):
+    """
+    lazy search results for django paginators, cached per search index generation
+
+    subclasses fetch a page of results together with the total count and the facet counts
+    """
+    backend = None
+
+    def __init__(self, term, start, stop, min_hits=None, filters=None, cache_key=None):
+        self.term = term
+        self.filters = filters or dict()
+        self.cache_key = cache_key
+        self.start = start
+        self.stop = stop
+        self.min_hits = settings.SEARCH_MIN_HITS if min_hits is None else min_hits
+        self._results = dict()
+        self._total = None
+        self._facets = None
+        super().__init__()
+
+    def _execute(self, start, stop):
+        if (start, stop) not in self._results and self.cache_key is not None:
+            # results are cached by search index generation, no purge is needed after index updates
+            key = RESULT_KEY.format(
+                generation=get_generation(), backend=self.backend, key=self.cache_key, start=start, stop=stop)
+            cached = caches[settings.SEARCH_CACHE].get(key)
+            if cached is None:
+                metrics.increment(METRIC_CACHE_MISS)
+                self._search_results(start, stop)
+                if self.is_cacheable():
+                    caches[settings.SEARCH_CACHE].set(key, (self._total, self._facets, self._results[(start, stop)]),
+                              timeout=settings.SEARCH_CACHE_TIMEOUT)
+            else:
+                metrics.increment(METRIC_CACHE_HIT)
+                self._total, facets, self._results[(start, stop)] = cached
+                if self._facets is None:
+                    self._facets = facets
+        return self._search_results(start, stop)
+
+    def _search_results(self, start, stop):
+        if (start, stop) not in self._results:
+            self._total, facets, self._results[(start, stop)] = self.search(start, stop)
+            if self._facets is None:
+                self._facets = facets
+        return self._results[(start, stop)]
+
+    @abstractmethod
+    def search(self, start, stop):
+        """
+        get the total count, the facets and the results from start to stop
+        """
+
+    def is_cacheable(self):
+        return True
+
+    def get_facet(self, facet, counts):
+        selected = self.filters.get(facet.name, [])
+        return {
+            'name': facet.name,
+            'label': facet.label,
+            'buckets': [{
+                'value': value,
+                'label': facet.get_label(value),
+                'count': count,
+                'selected': value in selected,
+            } for value, count in counts],
+        }
+
+    @property
+    def facets(self):
+        if self._facets is None:
+            self._execute(self.start, self.stop)
+        return self._facets
+
+    def count(self):
+        if self._total is None:
+            self._execute(self.start, self.stop)
+        return self._total
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self._execute(item.start or 0, item.stop if item.stop is not None else self.count())
+        return self._execute(item, item + 1)[0]
+
+
+class SearchResultList(BaseSearchResultList):
+    """
+    search results from elasticsearch, falls back to the database while elasticsearch is unavailable
+
+    the next search tier is only executed if the current one finds too few results
+    """
+    backend = BACKEND_ELASTICSEARCH
+    SOURCE_FIELDS = ['username', 'name', 'type', 'description', 'last_push']
+
+    def __init__(self, *args, fallback=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fallback = fallback
+        self.searches = [self._prepare(search) for search in RepositoryDocument.search_all(term=self.term)]
+        self._search = None
+        self._fallback = None
+
+    def _prepare(self, search):
+        search = search.source(self.SOURCE_FIELDS).highlight_options(encoder='html').highlight(
+            'description', fragment_size=150, number_of_fragments=1)
+
+        # selected facets don't influence the score and are cached by elasticsearch
+        for facet in FACETS:
+            if facet.name in self.filters:
+                search = search.filter('terms', **{facet.field: self.filters[facet.name]})
+            search.aggs.bucket(facet.name, 'terms', field=facet.field, size=facet.size)
+        return search
+
+    def search(self, start, stop):
+        if self._fallback is None:
+            try:
+                return self._search_elasticsearch(start, stop)
+            except ElasticsearchException as e:
+                if not self.fallback:
+                    raise
+                logger.warning('Search falls back to the database: %s', e)
+                cache.set(ELASTICSEARCH_DOWN_KEY, True, timeout=settings.SEARCH_FALLBACK_TIMEOUT)
+                self._fallback = DatabaseSearchResultList(
+                    self.term, self.start, self.stop, min_hits=self.min_hits, filters=self.filters)
+        return self._fallback.search(start, stop)
+
+    def _search_elasticsearch(self, start, stop):
+        # pick the first search tier with enough hits
+        if self._search is None:
+            for search in self.searches:
+                response = search[start:stop].execute()
+                self._search = search
+                if response.hits.total >= self.min_hits:
+                    break
+        else:
+            response = self._search[start:stop].execute()
+
+        facets = [
+            self.get_facet(facet, [
+                (bucket.key, bucket.doc_count) for bucket in getattr(response.aggregations, facet.name).buckets
+            ])
+            for facet in FACETS
+        ]
+        return response.hits.total, [facet for facet in facets if facet['buckets']], [
+            SearchResult.from_hit(hit) for hit in response
+        ]
+
+    def is_cacheable(self):
+        # don't store database results as elasticsearch results
+        return self._fallback is None
+
+
+class DatabaseSearchResultList(BaseSearchResultList):
+    """
+    search results from the postgres full text search vector of the repositories
+
+    prefix matching of all words is tried first, trigram similarity of names only if it finds too few results
+    """
+    backend = BACKEND_POSTGRES
+    SEARCH_CONFIG = 'english'
+    VALUES = ('id', 'user__username', 'name', 'type', 'description', 'last_push')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._queryset = None
+
+    def get_search_query(self):
+        words = re.findall(r'\w+', self.term)
+        if not words:
+            return None
+        return SearchQuery(' & '.join('{}:*'.format(word) for word in words), config=self.SEARCH_CONFIG,
+                           search_type='raw')
+
+    def get_querysets(self):
+        """
+        get the search tiers
+        """
+        queryset = filter_repositories(Repository.objects.all(), self.filters)
+        query = self.get_search_query()
+        if query is None:
+            return [queryset.none()]
+
+        exact = queryset.filter(search_vector=query).annotate(
+            score=SearchRank(F('search_vector'), query)).order_by('-score', '-last_push', '-id')
+        fuzzy = queryset.filter(
+            Q(search_vector=query) | Q(name__trigram_similar=self.term) | Q(user__username__trigram_similar=self.term)
+        ).annotate(
+            score=SearchRank(F('search_vector'), query) + Greatest(
+                TrigramSimilarity('name', self.term), TrigramSimilarity('user__username', self.term))
+        ).order_by('-score', '-last_push', '-id')
+        return [exact, fuzzy]
+
+    def search(self, start, stop):
+        # pick the first search tier with enough hits
+        if self._queryset is None:
+            for queryset in self.get_querysets():
+                self._queryset = queryset
+                total = queryset.count()
+                if total >= self.min_hits:
+                    break
+        else:
+            total = self._queryset.count()
+
+        results = [SearchResult.from_values(values) for values in self._queryset.values(*self.VALUES)[start:stop]]
+        return total, self.get_facets(), results
+
+    def get_facets(self):
+        facets = []
+        queryset = self._queryset.order_by()
+        for facet in FACETS:
+            if facet.multiple:
+                # array values are counted in python, the matching rows of small deployments are few
+                counter = Counter()
+                for values in queryset.values_list(facet.field, flat=True):
+                    counter.update(values or [])
+                counts = counter.most_common(facet.size)
+            else:
+                counts = [
+                    (facet.get_index_value(row[facet.field]), row['total'])
+                    for row in queryset.exclude(**{facet.field + '__isnull': True}).exclude(
+                        **{facet.field: ''} if facet.db_values is None else {}).values(facet.field).annotate(
+                        total=Count('id')).order_by('-total', facet.field)[:facet.size]
+                ]
+            facet = self.get_facet(facet, counts)
+            if facet['buckets']:
+                facets.append(facet)
+        return facets
+
+
+def get_search_result_list(term, start, stop, **kwargs):
+    if is_elasticsearch_available():
+        return SearchResultList(term, start, stop, **kwargs)
+    return DatabaseSearchResultList(term, start, stop, **kwargs)
+
+
+def search_repositories(term, page=1, page_size=20, filters=None):
+    term = normalize_term(term)
+    start = (max(page, 1) - 1) * page_size
+    cache_key = sha1(json.dumps([term, filters or dict()], sort_keys=True).encode('utf-8')).hexdigest()
+    return get_search_result_list(term, start=start, stop=start + page_size, filters=filters, cache_key=cache_key)
@@ -0,0 +1,131 @@
+# -*- coding: UTF-8 -*-
+import logging
+
+from django.db.models import Case, When, Value
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from haindex.common.util.catalog import bump_catalog_version
+from haindex.common.util.github import TokenPool, get_session
+from haindex.common.util.indexer import queue_index_update
+from haindex.documents import RepositoryDocument
+from haindex.models import Repository
+
+logger = logging.getLogger(__name__)
+
+
+class RepositoryStatsUpdater(object):
+    """
+    refresh repository stats of many repositories with batched GitHub GraphQL queries
+    """
+    GRAPHQL_URL = 'https://api.github.com/graphql'
+    BATCH_SIZE = 100
+    REPOSITORY_QUERY = '''
+        r{index}: repository(owner: $owner{index}, name: $name{index}) {{
+            stargazers {{ totalCount }}
+            forkCount
+            issues(states: OPEN) {{ totalCount }}
+            pullRequests(states: OPEN) {{ totalCount }}
+            pushedAt
+        }}'''
+    UPDATE_FIELDS = ('stargazers_count', 'forks_count', 'issues_count', 'last_push')
+
+    def __init__(self, batch_size=None, *args, **kwargs):
+        self.batch_size = batch_size or self.BATCH_SIZE
+        super().__init__(*args, **kwargs)
+
+    def get_token(self):
+        return TokenPool().get_token(resource='graphql')
+
+    def update(self, repository_ids):
+        repositories = Repository.objects.filter(id__in=repository_ids).values_list('id', 'user__username', 'name')
+        return self.update_many(repositories.iterator())
+
+    def update_many(self, repositories):
+        """
+        update stats of an iterable of (id, owner, name) tuples, returns the number of updated repositories
+        """
+        # the graphql api rejects unauthenticated requests, retrying them would only use up the task retries
+        if not TokenPool().get_tokens():
+            logger.error('No GitHub API token configured, skipping the repository stats update')
+            return 0
+
+        updated = 0
+        batch = []
+        for repository in repositories:
+            batch.append(repository)
+            if len(batch) >= self.batch_size:
+                updated += self._save(self._fetch(batch))
+                batch = []
+        if batch:
+            updated += self._save(self._fetch(batch))
+        return updated
+
+    def _fetch(self, batch):
+        # build one aliased repository query per batch entry
+        declarations = []
+        selections = []
+        variables = {}
+        for index, (repository_id, owner, name) in enumerate(batch):
+            declarations.append('$owner{index}: String!, $name{index}: String!'.format(index=index))
+            selections.append(self.REPOSITORY_QUERY.format(index=index))
+            variables['owner{}'.format(index)] = owner
+            variables['name{}'.format(index)] = name
+        query = 'query({declarations}) {{{selections}\n}}'.format(
+            declarations=', '.join(declarations), selections=''.join(selections))
+
+        token = self.get_token()
+        response = get_session().post(self.GRAPHQL_URL, json={'query': query, 'variables': variables},
+                                      headers={'Authorization': 'bearer {token}'.format(token=token)}, timeout=30)
+        TokenPool().record(token, response.headers, resource='graphql')
+        response.raise_for_status()
+        result = response.json()
+
+        # unknown repositories are reported as errors, the next full update removes them
+        for error in result.get('errors', []):
+            logger.warning('GitHub GraphQL error: %s', error.get('message'))
+
+        data = result.get('data') or {}
+        stats = dict()
+        for index, (repository_id, owner, name) in enumerate(batch):
+            repo = data.get('r{}'.format(index))
+            if not repo:
+                continue
+            stats[repository_id] = {
+                'stargazers_count': repo['stargazers']['totalCount'],
+                'forks_count': repo['forkCount'],
+                # the REST API counts open pull requests as issues as well
+                'issues_count': repo['issues']['totalCount'] + repo['pullRequests']['totalCount'],
+                'last_push': parse_datetime(repo['pushedAt']) if repo['pushedAt'] else None,
+            }
+        return stats
+
+    def _save(self, stats):
+        if not stats:
+            return 0
+
+        current = list(Repository.objects.filter(id__in=stats.keys()).values_list(
+            'id', 'last_push', 'stargazers_count'))
+        pushed_ids = {
+            repository_id for repository_id, last_push, stargazers_count in current
+            if last_push != stats[repository_id]['last_push']
+        }
+
+        # last push and the suggestion weight are part of the search index, queue changed repositories
+        queue_index_update(pushed_ids | {
+            repository_id for repository_id, last_push, stargazers_count in current
+            if RepositoryDocument.get_suggest_weight(stargazers_count) != RepositoryDocument.get_suggest_weight(
+                stats[repository_id]['stargazers_count'])
+        })
+
+        # last push is part of the catalog
+        if pushed_ids:
+            bump_catalog_version()
+
+        # write all stats with a single update statement, the detail pages show them
+        return Repository.objects.filter(id__in=stats.keys()).update(detail_changed=timezone.now(), **{
+            field: Case(
+                *[When(id=repository_id, then=Value(values[field])) for repository_id, values in stats.items()],
+                output_field=Repository._meta.get_field(field))
+            for field in self.UPDATE_FIELDS
+        })
@@ -1,40 +1,89 @@
 # -*- coding: UTF-8 -*-
 import logging
 import os
+from functools import reduce
+from operator import or_
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator, EmailValidator
+from django.db.models import Q
 from django.urls import reverse
 from django.utils import timezone
-from github import Github, UnknownObjectException, GithubException
+from github import UnknownObjectException, GithubException, RateLimitExceededException
 import yaml
 
+from haindex.common.util.dependencies import DependencyGraph
+from haindex.common.util.detail import touch_repository_details
+from haindex.common.util.github import TokenPool, RateLimitExhausted, get_pooled_client
+from haindex.common.util.indexer import queue_index_update
 from haindex.common.util.readme import ReadmeRenderer
 from haindex.models import Repository, RepositoryRelease
 
 logger = logging.getLogger(__name__)
 
 
+def get_or_create_repositories(keys):
+    """
+    resolve (username, name) pairs to repositories in bulk, missing users and repositories are created
+
+    returns a dict of repositories by key and the set of created repository ids
+    """
+    keys = set(keys)
+    if not keys:
+        return dict(), set()
+
+    # get or create users
+    user_model = get_user_model()
+    usernames = {username for username, name in keys}
+    users = dict(user_model.objects.filter(username__in=usernames).values_list('username', 'id'))
+    if usernames - users.keys():
+        user_model.objects.bulk_create([
+            user_model(username=username) for username in usernames - users.keys()
+        ], ignore_conflicts=True)
+        users = dict(user_model.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+    # get or create repositories
+    query = reduce(or_, [Q(user_id=users[username], name=name) for username, name in keys])
+    repositories = {(repository.user.username, repository.name): repository
+                    for repository in Repository.objects.filter(query).select_related('user')}
+    created_ids = set()
+    if keys - repositories.keys():
+        known_ids = {repository.id for repository in repositories.values()}
+        Repository.objects.bulk_create([
+            Repository(user_id=users[username], name=name) for username, name in keys - repositories.keys()
+        ], ignore_conflicts=True)
+        repositories = {(repository.user.username, repository.name): repository
+                        for repository in Repository.objects.filter(query).select_related('user')}
+        created_ids = {repository.id for repository in repositories.values()} - known_ids
+
+        # bulk created rows don't send signals
+        queue_index_update(created_ids)
+
+    return repositories, created_ids
+
+
 class RepositoryUpdater(object):
     def __init__(self, repository, *args, **kwargs):
         assert isinstance(repository, Repository)
 
         self.repository = repository
         self._file_list = None
+        self._tree_sha = None
         super().__init__(*args, **kwargs)
 
     def get_client(self):
-        # authenticate as repository owner
+        # prefer the repository owner's token, fall back to the system token pool
+        tokens = TokenPool().get_tokens()
         auth = self.repository.user.social_auth.filter(provider='github').first()
         if auth:
             access_token = auth.extra_data.get('access_token')
             if access_token:
-                return Github(login_or_token=access_token)
+                tokens.insert(0, access_token)
 
-        # default system user access
-        return Github(login_or_token=settings.GITHUB_API_USER, password=settings.GITHUB_API_TOKEN)
+        return get_pooled_client(tokens=tokens)
 
     def _load_repo(self):
         try:
@@ -42,33 +91,23 @@ class RepositoryUpdater(object):
                 user=self.repository.user.username, name=self.repository.name), lazy=False)
         except UnknownObjectException:
             # repository wasn't found on github, let's delete it
-            self.repository.delete()
+            DependencyGraph().remove(self.repository)
+        except (RateLimitExhausted, RateLimitExceededException):
+            raise
         except Exception as e:
             logger.exception(e)
 
         return None
 
-    def update(self):
+    def update(self, force=False):
         # get repository
         repo = self._load_repo()
         if not repo:
             return
 
-        # get contents
-        try:
-            contents = repo.get_contents('')
-        except GithubException as e:
-            logger.exception(e)
-            return
-
         # build list of fields to update
         update_fields = []
 
-        # update description
-        if repo.description:
-            self.repository.description = repo.description
-            update_fields.append('description')
-
         # update stat counts
         self.repository.stargazers_count = repo.stargazers_count
         update_fields.append('stargazers_count')
@@ -88,17 +127,46 @@ class RepositoryUpdater(object):
             self.repository.user_type = getattr(Repository.USER_TYPE_CHOICES, Repository.USER_TYPE_USER)
         update_fields.append('user_type')
 
-        # get latest commit hash
+        # get latest commit hash of the default branch
         try:
-            latest_commit = repo.get_commits()[0]
-            self.repository.last_commit_id = latest_commit.sha
-            update_fields.append('last_commit_id')
+            latest_commit = repo.get_branch(repo.default_branch).commit
+        except (RateLimitExhausted, RateLimitExceededException):
+            raise
         except GithubException as e:
             logger.exception(e)
             return
 
+        # repository is unchanged since the last import, only refresh stats and releases
+        # (releases may be published for an existing commit)
+        if not force and self.repository.last_import and self.repository.last_commit_id == latest_commit.sha:
+            self.repository.last_import = timezone.now()
+            update_fields.append('last_import')
+            self.repository.save(update_fields=set(update_fields))
+            self._update_releases(repo=repo)
+            touch_repository_details([self.repository.id, self.repository.parent_repository_id])
+            return
+
+        self.repository.last_commit_id = latest_commit.sha
+        update_fields.append('last_commit_id')
+        self._tree_sha = latest_commit.commit.tree.sha
+
+        # get contents
+        try:
+            contents = repo.get_contents('')
+        except (RateLimitExhausted, RateLimitExceededException):
+            raise
+        except GithubException as e:
+            logger.exception(e)
+            return
+
+        # update description
+        if repo.description:
+            self.repository.description = repo.description
+            update_fields.append('description')
+
         # try to get package.yaml and readme from the project root
         package = None
+        readme = None
         for item in contents:
             # try to load package description
             if item.type == 'file' and item.path.lower() == 'package.yaml':
@@ -110,42 +178,49 @@ class RepositoryUpdater(object):
             # try to load readme
             elif item.type == 'file' and item.path.lower() in ('readme', 'readme.md', 'readme.rst', 'readme.txt'):
                 filename, extension = os.path.splitext(item.path.lower())
-                self.repository.readme = ReadmeRenderer().get_html(
-                    content=item.decoded_content.decode('UTF-8'), extension=extension)
-                update_fields.append('readme')
+                readme = ReadmeRenderer().render(
+                    sha=item.sha, load_content=lambda item=item: item.decoded_content.decode('UTF-8'),
+                    extension=extension)
+
+        # repositories discovered by this update will be indexed afterwards
+        discovered_ids = set()
+
+        # detail pages showing this repository as fork or dependency
+        touched_ids = {self.repository.id, self.repository.parent_repository_id}
 
         # set parent repository
         if repo.fork and repo.parent:
-            parent_repository_user, created = get_user_model().objects.get_or_create(username=repo.parent.owner.login)
-
-            parent_repository, created = Repository.objects.get_or_create(
-                user=parent_repository_user, name=repo.parent.name)
-            self.repository.parent_repository = parent_repository
+            parent_key = (repo.parent.owner.login, repo.parent.name)
+            repositories, created_ids = get_or_create_repositories([parent_key])
+            self.repository.parent_repository = repositories[parent_key]
             update_fields.append('parent_repository')
-
-            # index parent repository
-            if created:
-                from haindex.tasks import update_repository
-                update_repository.apply_async([parent_repository.id])
+            touched_ids.add(self.repository.parent_repository_id)
+            discovered_ids |= created_ids
 
         # handle package.yaml
         self.repository.has_package_file = package is not None
         update_fields.append('has_package_file')
 
         if package:
-            self.repository.dependencies.clear()
+            dependency_keys = set()
             if 'dependencies' in package:
                 for dependency in package['dependencies']:
-                    dependency_username, dependency_repo_name = dependency.split('/')
-                    dependency_user, created = get_user_model().objects.get_or_create(username=dependency_username)
-
-                    dependency_repository, created = Repository.objects.get_or_create(
-                        user=dependency_user, name=dependency_repo_name)
-
-                    if created:
-                        from haindex.tasks import update_repository
-                        update_repository.apply_async([dependency_repository.id])
-                    self.repository.dependencies.add(dependency_repository)
+                    dependency_key = tuple(str(dependency).split('/'))
+                    if len(dependency_key) == 2 and all(dependency_key):
+                        dependency_keys.add(dependency_key)
+
+            # only change the dependency rows that were added or removed
+            repositories, created_ids = get_or_create_repositories(dependency_keys)
+            dependency_ids = {repository.id for repository in repositories.values()}
+            current_ids = set(self.repository.dependencies.values_list('id', flat=True))
+            if current_ids - dependency_ids:
+                self.repository.dependencies.remove(*(current_ids - dependency_ids))
+            if dependency_ids - current_ids:
+                self.repository.dependencies.add(*(dependency_ids - current_ids))
+            if current_ids != dependency_ids:
+                DependencyGraph().update(self.repository.id)
+                touched_ids |= current_ids ^ dependency_ids
+            discovered_ids |= created_ids
 
             self.repository.files = []
             if 'files' in package:
@@ -197,7 +272,7 @@ class RepositoryUpdater(object):
 
         # guess extension type by js/py file count in repository if not yet set
         if not self.repository.type:
-            file_list = self._get_filelist(repo=repo, contents=contents)
+            file_list = self._get_filelist(repo=repo)
 
             if file_list.get_count('.js') > 0 or file_list.get_count('.py') > 0:
                 if file_list.get_count('.js') > file_list.get_count('.py'):
@@ -209,12 +284,17 @@ class RepositoryUpdater(object):
         # guess required files by file extension
         if not self.repository.files or len(self.repository.files) == 0:
             if self.repository.type == Repository.TYPE_COMPONENT_ID:
-                self.repository.files = self._get_filelist(repo=repo, contents=contents).get_files(extension='.py')
+                self.repository.files = self._get_filelist(repo=repo).get_files(extension='.py')
                 update_fields.append('files')
             elif self.repository.type == Repository.TYPE_LOVELACE_ID:
-                self.repository.files = self._get_filelist(repo=repo, contents=contents).get_files(extension='.js')
+                self.repository.files = self._get_filelist(repo=repo).get_files(extension='.js')
                 update_fields.append('files')
 
+        # collect the rendered readme
+        if readme:
+            self.repository.readme = readme.get_html()
+            update_fields.append('readme')
+
         # set last update
         self.repository.last_import = timezone.now()
         update_fields.append('last_import')
@@ -222,44 +302,72 @@ class RepositoryUpdater(object):
         # save updated data
         self.repository.save(update_fields=set(update_fields))
 
+        # index discovered repositories
+        if discovered_ids:
+            from haindex.tasks import schedule_repository_updates
+            schedule_repository_updates(discovered_ids)
+
         # update releases
+        self._update_releases(repo=repo)
+        touch_repository_details(touched_ids)
+
+    def _update_releases(self, repo):
+        known_tags = set(RepositoryRelease.objects.filter(
+            repository=self.repository).values_list('tag_name', flat=True))
+
+        # releases are listed newest first, stop paging at the first page with a known release
+        new_releases = []
+        known_releases = dict()
         try:
             releases = repo.get_releases()
+            page = 0
+            while not known_releases:
+                items = releases.get_page(page)
+                if not items:
+                    break
+                for release in items:
+                    # skip draft releases
+                    if release.published_at is None:
+                        continue
+                    if release.tag_name in known_tags:
+                        known_releases[release.tag_name] = release
+                    else:
+                        new_releases.append(release)
+                page += 1
+        except (RateLimitExhausted, RateLimitExceededException):
+            raise
         except GithubException as e:
             logger.exception(e)
             return
-        for release in releases:
-            RepositoryRelease.objects.get_or_create(
-                repository=self.repository, tag_name=release.tag_name, defaults=dict(
-                    body=release.body, published_at=release.published_at, zipball_url=release.zipball_url))
 
-    def _get_filelist(self, repo, contents):
+        # insert new releases
+        RepositoryRelease.objects.bulk_create([
+            RepositoryRelease(repository=self.repository, tag_name=release.tag_name, **self._get_release_data(release))
+            for release in new_releases
+        ], ignore_conflicts=True)
+
+        # update changed releases
+        changed_releases = []
+        for stored in RepositoryRelease.objects.filter(repository=self.repository, tag_name__in=known_releases.keys()):
+            data = self._get_release_data(known_releases[stored.tag_name])
+            if any(getattr(stored, field) != value for field, value in data.items()):
+                for field, value in data.items():
+                    setattr(stored, field, value)
+                changed_releases.append(stored)
+        RepositoryRelease.objects.bulk_update(changed_releases, fields=['body', 'published_at', 'zipball_url'])
+
+    def _get_release_data(self, release):
+        published_at = release.published_at
+        if timezone.is_naive(published_at):
+            published_at = timezone.make_aware(published_at, timezone.utc)
+        return dict(body=release.body or '', published_at=published_at, zipball_url=release.zipball_url)
+
+    def _get_filelist(self, repo):
         if self._file_list is None:
-            self._file_list = FileList(repo=repo)
-            self._file_list.count(contents=contents)
+            self._file_list = FileList(repo=repo, tree_sha=self._tree_sha)
+            self._file_list.count()
         return self._file_list
 
-    def update_stats(self, repository):
-        assert isinstance(repository, Repository)
-
-        # get repository
-        repo = self._load_repo()
-        if not repo:
-            return
-
-        # build list of fields to update
-        update_fields = []
-
-        # update stat counts
-        repository.stargazers_count = repo.stargazers_count
-        update_fields.append('stargazers_count')
-        repository.forks_count = repo.forks_count
-        update_fields.append('forks_count')
-        repository.issues_count = repo.open_issues_count
-        update_fields.append('issues_count')
-
-        repository.save(update_fields=update_fields)
-
     def subscribe(self):
         # webhook creation is not enabled
         if not settings.GITHUB_WEBHOOK_ENABLED:
@@ -285,30 +393,47 @@ class RepositoryUpdater(object):
 
 
 class FileList(object):
-    def __init__(self, repo):
+    CACHE_KEY = 'github:filelist:{tree_sha}'
+
+    def __init__(self, repo, tree_sha):
         self.extensions = dict()
         self.files = dict()
         self.repo = repo
+        self.tree_sha = tree_sha
         super().__init__()
 
-    def count(self, contents):
-        for item in contents:
-            # search directories recursively
-            if item.type == 'dir':
-                try:
-                    self.count(contents=self.repo.get_contents(item.path))
-                except GithubException as e:
-                    logger.exception(e)
-                    return
+    def count(self):
+        # trees are immutable, reuse a histogram computed for the same tree
+        cache = caches[settings.GITHUB_CACHE]
+        cache_key = self.CACHE_KEY.format(tree_sha=self.tree_sha)
+        cached = cache.get(cache_key)
+        if cached:
+            self.extensions, self.files = cached['extensions'], cached['files']
+            return
+
+        # list all files with a single recursive tree request
+        try:
+            tree = self.repo.get_git_tree(self.tree_sha, recursive=True)
+        except (RateLimitExhausted, RateLimitExceededException):
+            raise
+        except GithubException as e:
+            logger.exception(e)
+            return
+        if tree.raw_data.get('truncated'):
+            logger.warning('File tree of %s is truncated', self.repo.full_name)
 
-            # count files
-            if item.type == 'file':
+        # count files
+        for item in tree.tree:
+            if item.type == 'blob':
                 filename, file_extension = os.path.splitext(item.path.lower())
                 self.extensions.setdefault(file_extension, 0)
                 self.extensions[file_extension] += 1
                 self.files.setdefault(file_extension, list())
                 self.files[file_extension].append(item.path.lower())
 
+        cache.set(cache_key, {'extensions': self.extensions, 'files': self.files},
+                  timeout=settings.GITHUB_CACHE_TIMEOUT)
+
     def get_count(self, extension):
         if extension not in self.extensions:
             return 0
@@ -0,0 +1,100 @@
+# -*- coding: UTF-8 -*-
+import json
+import logging
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from haindex.common.util.updater import get_or_create_repositories
+from haindex.models import Repository, WebhookDelivery
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookProcessor(object):
+    """
+    drain the webhook inbox and dispatch the resulting repository updates in bulk
+    """
+    UPDATE_EVENTS = ('push',)
+    STATS_EVENTS = ('watch', 'issues', 'pull_request')
+    FORK_EVENTS = ('fork',)
+    BATCH_SIZE = 500
+    RETENTION = timedelta(days=7)
+
+    def __init__(self, batch_size=None, *args, **kwargs):
+        self.batch_size = batch_size or self.BATCH_SIZE
+        super().__init__(*args, **kwargs)
+
+    def process(self):
+        """
+        process one batch of pending deliveries, returns the number of processed deliveries
+        """
+        from haindex.tasks import schedule_repository_updates, schedule_repository_stats_update
+
+        with transaction.atomic():
+            deliveries = list(WebhookDelivery.objects.select_for_update(skip_locked=True).filter(
+                processed__isnull=True).order_by('id')[:self.batch_size])
+            if not deliveries:
+                return 0
+
+            # dedupe events by repository
+            updates = set()
+            stats = set()
+            forks = set()
+            for delivery in deliveries:
+                try:
+                    payload = json.loads(delivery.payload)
+                    repository = (payload['repository']['owner']['login'], payload['repository']['name'])
+                    if delivery.event in self.UPDATE_EVENTS:
+                        updates.add(repository)
+                    elif delivery.event in self.STATS_EVENTS:
+                        stats.add(repository)
+                    elif delivery.event in self.FORK_EVENTS:
+                        forks.add((payload['forkee']['owner']['login'], payload['forkee']['name']))
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning('Invalid webhook delivery %s: %s', delivery.delivery_id, e)
+
+            # resolve known repositories with a single query
+            repository_ids = self._get_repository_ids(updates | stats)
+
+            # forks are new repositories most of the time
+            fork_repositories, created_ids = get_or_create_repositories(forks)
+            fork_ids = {repository.id for repository in fork_repositories.values()}
+
+            update_ids = {repository_ids[repository] for repository in updates if repository in repository_ids}
+            update_ids |= fork_ids
+            stats_ids = {repository_ids[repository] for repository in stats if repository in repository_ids}
+            schedule_repository_updates(update_ids)
+            for repository_id in sorted(stats_ids - update_ids):
+                schedule_repository_stats_update(repository_id)
+
+            WebhookDelivery.objects.filter(id__in=[delivery.id for delivery in deliveries]).update(
+                processed=timezone.now())
+
+        return len(deliveries)
+
+    def process_all(self):
+        processed = 0
+        while True:
+            count = self.process()
+            if not count:
+                break
+            processed += count
+
+        # remove old deliveries
+        WebhookDelivery.objects.filter(processed__lt=timezone.now() - self.RETENTION).delete()
+        return processed
+
+    def _get_repository_ids(self, repositories):
+        if not repositories:
+            return dict()
+        query = reduce(or_, [Q(user__username=username, name=name) for username, name in repositories])
+        return {
+            (username, name): repository_id
+            for repository_id, username, name in Repository.objects.filter(query).values_list(
+                'id', 'user__username', 'name')
+        }
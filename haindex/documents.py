@@ -1,15 +1,21 @@
 # -*- coding: UTF-8 -*-
+import math
+
 from django_elasticsearch_dsl import DocType, Index, fields
 from elasticsearch_dsl import analyzer
-from elasticsearch_dsl.query import MultiMatch
+from elasticsearch_dsl.query import Bool, Match, MultiMatch
 
 from haindex import models
 
-search_index = Index('haindex')
-search_index.settings(
-    number_of_shards=1,
-    number_of_replicas=0
-)
+# the index name is an alias of the versioned index built by the reindexer
+INDEX_NAME = 'haindex'
+INDEX_SETTINGS = {
+    'number_of_shards': 1,
+    'number_of_replicas': 0,
+}
+
+search_index = Index(INDEX_NAME)
+search_index.settings(**INDEX_SETTINGS)
 
 html_strip = analyzer(
     'html_strip',
@@ -29,6 +35,22 @@ class RepositoryDocument(DocType):
             'raw': fields.StringField(analyzer='keyword'),
         }
     )
+    suggest = fields.CompletionField()
+
+    # facets
+    type = fields.KeywordField()
+    user_type = fields.KeywordField()
+    license = fields.KeywordField()
+    keywords = fields.KeywordField(multi=True)
+
+    TYPE_NAMES = {
+        models.Repository.TYPE_LOVELACE_ID: models.Repository.TYPE_LOVELACE,
+        models.Repository.TYPE_COMPONENT_ID: models.Repository.TYPE_COMPONENT,
+    }
+    USER_TYPE_NAMES = {
+        models.Repository.USER_TYPE_USER_ID: models.Repository.USER_TYPE_USER,
+        models.Repository.USER_TYPE_ORG_ID: models.Repository.USER_TYPE_ORG,
+    }
 
     class Meta:
         model = models.Repository
@@ -37,16 +59,14 @@ class RepositoryDocument(DocType):
             'author_name',
             'description',
             'last_push',
-            'type',
         ]
         queryset_pagination = 100
 
     def get_queryset(self):
         """
         order queryset for consistent pagination
-        only index extensions with a package file
         """
-        return super().get_queryset().order_by('id')
+        return super().get_queryset().select_related('user').order_by('id')
 
     def prepare_keywords_text(self, instance):
         if instance.keywords is not None:
@@ -56,15 +76,82 @@ class RepositoryDocument(DocType):
     def prepare_username(self, instance):
         return instance.user.username
 
+    def prepare_type(self, instance):
+        return self.TYPE_NAMES.get(instance.type)
+
+    def prepare_user_type(self, instance):
+        return self.USER_TYPE_NAMES.get(instance.user_type)
+
+    def prepare_license(self, instance):
+        return instance.license or None
+
+    def prepare_keywords(self, instance):
+        return instance.keywords or []
+
+    def prepare_suggest(self, instance):
+        inputs = [instance.name, instance.user.username, '{}/{}'.format(instance.user.username, instance.name)]
+        inputs += instance.keywords or []
+        return {
+            'input': [value for value in inputs if value],
+            'weight': self.get_suggest_weight(instance.stargazers_count),
+        }
+
+    @classmethod
+    def get_suggest_weight(cls, stargazers_count):
+        """
+        rank suggestions by popularity, logarithmic so stars changes rarely require a reindex
+        """
+        return 1 + int(math.log2(1 + (stargazers_count or 0)))
+
+    @classmethod
+    def suggest_all(cls, prefix, size=10):
+        """
+        get completion suggestions of extension names, owners and keywords for a prefix
+        """
+        return cls.search().source(['username', 'name', 'type']).extra(size=0).suggest(
+            'extensions', prefix, completion={'field': 'suggest', 'size': size, 'skip_duplicates': True})
+
+    @classmethod
+    def get_exact_query(cls, term):
+        """
+        exact, phrase prefix and plain readme matching, cheap enough for every request
+        """
+        return Bool(should=[
+            MultiMatch(query=term, operator='and', fields=[
+                'username^5',
+                'name^5',
+                'keywords_text^3',
+                'author_name',
+                'description',
+            ]),
+            MultiMatch(query=term, type='phrase_prefix', max_expansions=10, fields=[
+                'username^5',
+                'name^5',
+            ]),
+            Match(readme={'query': term, 'operator': 'and', 'boost': 0.5}),
+        ], minimum_should_match=1)
+
+    @classmethod
+    def get_fuzzy_query(cls, term):
+        """
+        exact matches plus fuzzy matching restricted to short fields
+        """
+        return Bool(should=[
+            cls.get_exact_query(term),
+            MultiMatch(query=term, fuzziness='AUTO', prefix_length=1, max_expansions=20, fields=[
+                'username^2',
+                'name^2',
+                'keywords_text',
+                'author_name',
+            ]),
+        ], minimum_should_match=1)
+
     @classmethod
     def search_all(cls, term):
-        query = MultiMatch(query=term, fuzziness=2, fields=[
-            'username^5',
-            'name^5',
-            'keywords_text^3',
-            'name',
-            'author_name',
-            'description',
-            'readme',
-        ])
-        return cls.search().query(query)
+        """
+        get the search tiers for a term, fuzzy matching is only used if exact matching finds too few results
+        """
+        return [
+            cls.search().query(cls.get_exact_query(term)),
+            cls.search().query(cls.get_fuzzy_query(term)),
+        ]
@@ -0,0 +1,81 @@
+# -*- coding: UTF-8 -*-
+import time
+
+from django.core.management.base import BaseCommand
+from elasticsearch_dsl.query import MultiMatch
+
+from haindex.common.util.search import SearchResultList
+from haindex.documents import RepositoryDocument
+from haindex.models import Repository
+
+
+class Command(BaseCommand):
+    help = 'Compare latency and recall of the tiered search against the former fuzzy query'
+
+    def add_arguments(self, parser):
+        parser.add_argument('terms', nargs='*', help='Search terms, derived from the indexed repositories if omitted')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of runs per term')
+        parser.add_argument('--size', type=int, default=20, help='Number of results to compare')
+
+    def get_terms(self):
+        # names, keywords and misspelled names of the indexed repositories
+        terms = []
+        for name, keywords in Repository.objects.order_by('id').values_list('name', 'keywords')[:50]:
+            terms.append(name)
+            if len(name) > 4:
+                terms.append(name[:2] + name[3] + name[2] + name[4:])
+            terms.extend((keywords or [])[:1])
+        return terms
+
+    def search_legacy(self, term, size):
+        query = MultiMatch(query=term, fuzziness=2, fields=[
+            'username^5',
+            'name^5',
+            'keywords_text^3',
+            'name',
+            'author_name',
+            'description',
+            'readme',
+        ])
+        return [int(hit.meta.id) for hit in RepositoryDocument.search().query(query).source(False)[:size].execute()]
+
+    def search_tiered(self, term, size):
+        # bypass the result cache
+        return [result.id for result in SearchResultList(term, 0, size)[0:size]]
+
+    def measure(self, func, term, size, repeat):
+        durations = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            ids = func(term, size)
+            durations.append(time.perf_counter() - start)
+        return ids, sorted(durations)
+
+    def handle(self, *args, **options):
+        terms = options['terms'] or self.get_terms()
+        size, repeat = options['size'], options['repeat']
+
+        legacy_durations, tiered_durations, recalls = [], [], []
+        for term in terms:
+            legacy_ids, legacy = self.measure(self.search_legacy, term, size, repeat)
+            tiered_ids, tiered = self.measure(self.search_tiered, term, size, repeat)
+            recall = len(set(legacy_ids) & set(tiered_ids)) / len(legacy_ids) if legacy_ids else 1
+            legacy_durations.extend(legacy)
+            tiered_durations.extend(tiered)
+            recalls.append(recall)
+            self.stdout.write('{term:30} legacy {legacy:7.1f}ms  tiered {tiered:7.1f}ms  recall {recall:5.1%}'.format(
+                term=term[:30], legacy=legacy[len(legacy) // 2] * 1000, tiered=tiered[len(tiered) // 2] * 1000,
+                recall=recall))
+
+        if not terms:
+            return
+
+        def percentile(durations, value):
+            durations = sorted(durations)
+            return durations[min(int(len(durations) * value), len(durations) - 1)] * 1000
+
+        self.stdout.write('')
+        for label, durations in (('legacy', legacy_durations), ('tiered', tiered_durations)):
+            self.stdout.write('{label}: p50 {p50:.1f}ms  p99 {p99:.1f}ms'.format(
+                label=label, p50=percentile(durations, 0.5), p99=percentile(durations, 0.99)))
+        self.stdout.write('mean recall@{size}: {recall:.1%}'.format(size=size, recall=sum(recalls) / len(recalls)))
@@ -0,0 +1,18 @@
+# -*- coding: UTF-8 -*-
+from django.core.management.base import BaseCommand
+
+from haindex.common.util.github import get_cache_stats, reset_cache_stats
+from haindex.common.util.metrics import format_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit and miss counters of the GitHub conditional request cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        self.stdout.write(format_cache_stats(**get_cache_stats()))
+
+        if options['reset']:
+            reset_cache_stats()
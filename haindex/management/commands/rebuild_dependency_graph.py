@@ -0,0 +1,11 @@
+# -*- coding: UTF-8 -*-
+from django.core.management.base import BaseCommand
+
+from haindex.common.util.dependencies import DependencyGraph
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the transitive dependency closure and dependents counts of all repositories'
+
+    def handle(self, *args, **options):
+        DependencyGraph().rebuild_all()
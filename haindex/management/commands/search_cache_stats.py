@@ -0,0 +1,19 @@
+# -*- coding: UTF-8 -*-
+from django.core.management.base import BaseCommand
+
+from haindex.common.util.metrics import format_cache_stats
+from haindex.common.util.search import get_cache_stats, get_generation, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit and miss counters of the search result cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        self.stdout.write('index generation: {generation}'.format(generation=get_generation()))
+        self.stdout.write(format_cache_stats(**get_cache_stats()))
+
+        if options['reset']:
+            reset_cache_stats()
@@ -0,0 +1,16 @@
+# -*- coding: UTF-8 -*-
+from django.core.management.base import BaseCommand
+
+from haindex.common.util.indexer import SearchReindexer
+
+
+class Command(BaseCommand):
+    help = 'Build a new search index in parallel and switch searches to it without downtime'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Number of threads sending bulk requests')
+        parser.add_argument('--chunk-size', type=int, help='Number of repositories per bulk request')
+
+    def handle(self, *args, **options):
+        name, count = SearchReindexer(workers=options['workers'], chunk_size=options['chunk_size']).reindex()
+        self.stdout.write('indexed {count} repositories into {name}'.format(count=count, name=name))
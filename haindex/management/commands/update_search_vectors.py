@@ -0,0 +1,14 @@
+# -*- coding: UTF-8 -*-
+from django.core.management.base import BaseCommand
+
+from haindex.common.util.indexer import update_search_vectors
+from haindex.common.util.search import bump_generation
+
+
+class Command(BaseCommand):
+    help = 'Update the full text search vectors of all repositories for the postgres search backend'
+
+    def handle(self, *args, **options):
+        count = update_search_vectors()
+        bump_generation()
+        self.stdout.write('updated {count} repositories'.format(count=count))
@@ -0,0 +1,37 @@
+# -*- coding: UTF-8 -*-
+import logging
+
+from django.conf import settings
+
+from haindex.common.util.queries import QueryCounter
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware(object):
+    """
+    record the sql queries of every request and report views exceeding their query budget
+    """
+
+    def __init__(self, get_response, *args, **kwargs):
+        self.get_response = get_response
+        super().__init__(*args, **kwargs)
+
+    def __call__(self, request):
+        with QueryCounter() as counter:
+            response = self.get_response(request)
+
+        view_name = request.resolver_match.url_name if request.resolver_match else None
+        budget = settings.QUERY_BUDGETS.get(view_name)
+        if budget is not None and counter.count > budget:
+            logger.warning('%s exceeded its query budget with %d of %d queries in %.1fms (%s)',
+                           view_name, counter.count, budget, counter.duration * 1000, request.path)
+        else:
+            logger.debug('%s ran %d queries in %.1fms (%s)',
+                         view_name, counter.count, counter.duration * 1000, request.path)
+
+        if settings.QUERY_BUDGET_HEADERS:
+            # queries of streaming responses happen later and are not included
+            response['X-Query-Count'] = str(counter.count)
+            response['X-Query-Time'] = '{:.1f}'.format(counter.duration * 1000)
+        return response
@@ -0,0 +1,31 @@
+# Generated by Django 2.1.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('haindex', '0002_repository_user_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookDelivery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('delivery_id', models.CharField(max_length=50, unique=True, verbose_name='Delivery ID')),
+                ('event', models.CharField(max_length=50, verbose_name='Event')),
+                ('payload', models.TextField(verbose_name='Payload')),
+                ('processed', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Processed')),
+            ],
+            options={
+                'verbose_name': 'Webhook delivery',
+                'verbose_name_plural': 'Webhook deliveries',
+                'ordering': ('id',),
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('haindex', '0003_webhookdelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='dependents_count',
+            field=models.IntegerField(default=0, verbose_name='Dependents count'),
+        ),
+        migrations.AddField(
+            model_name='repository',
+            name='has_dependency_cycle',
+            field=models.BooleanField(default=False, verbose_name='Has dependency cycle'),
+        ),
+        migrations.CreateModel(
+            name='RepositoryDependencyPath',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(verbose_name='Depth')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dependency_paths', to='haindex.Repository', verbose_name='Ancestor')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dependent_paths', to='haindex.Repository', verbose_name='Descendant')),
+            ],
+            options={
+                'verbose_name': 'Repository dependency path',
+                'verbose_name_plural': 'Repository dependency paths',
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('haindex', '0004_repositorydependencypath'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchIndexQueue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('repository_id', models.IntegerField(unique=True, verbose_name='Repository ID')),
+                ('queued', models.DateTimeField(auto_now_add=True, verbose_name='Queued')),
+            ],
+            options={
+                'verbose_name': 'Search index queue entry',
+                'verbose_name_plural': 'Search index queue',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-18 14:05
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('haindex', '0005_searchindexqueue'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='repository',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Search vector'),
+        ),
+        migrations.AddIndex(
+            model_name='repository',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='haindex_repository_search_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='repository',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='haindex_repository_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
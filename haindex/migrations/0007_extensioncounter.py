@@ -0,0 +1,39 @@
+# Generated by Django 2.2.28 on 2026-10-18 15:10
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def create_counters(apps, schema_editor):
+    Repository = apps.get_model('haindex', 'Repository')
+    ExtensionCounter = apps.get_model('haindex', 'ExtensionCounter')
+    totals = {
+        total['type']: total['total']
+        for total in Repository.objects.filter(type__isnull=False).values('type').annotate(total=Count('id'))
+    }
+    ExtensionCounter.objects.bulk_create([
+        ExtensionCounter(type=type_id, count=totals.get(type_id, 0)) for type_id in (1, 2)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('haindex', '0006_repository_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtensionCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.IntegerField(choices=[(1, 'Lovelace plugin'), (2, 'Custom component')], unique=True, verbose_name='Extension type')),
+                ('count', models.IntegerField(default=0, verbose_name='Count')),
+            ],
+            options={
+                'verbose_name': 'Extension counter',
+                'verbose_name_plural': 'Extension counters',
+            },
+        ),
+        migrations.RunPython(create_counters, migrations.RunPython.noop),
+    ]
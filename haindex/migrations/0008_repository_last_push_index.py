@@ -0,0 +1,20 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('haindex', '0007_extensioncounter'),
+    ]
+
+    operations = [
+        # the listing order and cursor condition, scanned backwards for descending pages
+        # expression indexes aren't supported by model indexes
+        migrations.RunSQL(
+            'CREATE INDEX haindex_repository_push_key_id ON haindex_repository '
+            '((COALESCE(last_push, \'-infinity\'::timestamptz)), id);',
+            'DROP INDEX haindex_repository_push_key_id;',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('haindex', '0009_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchindexqueue',
+            name='attempts',
+            field=models.IntegerField(default=0, verbose_name='Attempts'),
+        ),
+        migrations.AddField(
+            model_name='searchindexqueue',
+            name='retry_after',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Retry after'),
+        ),
+    ]
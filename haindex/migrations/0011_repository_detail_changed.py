@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 23:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('haindex', '0010_searchindexqueue_retry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='detail_changed',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Detail page changed'),
+        ),
+    ]
@@ -1,10 +1,12 @@
 # -*- coding: UTF-8 -*-
 from django.contrib.auth import get_user_model
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from django_extensions.db.models import TimeStampedModel
-from model_utils import Choices
+from model_utils import Choices, FieldTracker
 
 
 class Repository(TimeStampedModel):
@@ -57,6 +59,20 @@ class Repository(TimeStampedModel):
     files = ArrayField(base_field=models.CharField(max_length=100), blank=True, null=True, verbose_name=_('Files'))
     dependencies = models.ManyToManyField(to='haindex.Repository', related_name='provider', blank=True,
                                           verbose_name=_('Dependencies'))
+    dependents_count = models.IntegerField(default=0, verbose_name=_('Dependents count'))
+    has_dependency_cycle = models.BooleanField(default=False, verbose_name=_('Has dependency cycle'))
+    search_vector = SearchVectorField(null=True, editable=False, verbose_name=_('Search vector'))
+    # changes of the detail page that don't touch the modified timestamp, like stats, releases or dependents
+    detail_changed = models.DateTimeField(null=True, blank=True, editable=False, verbose_name=_('Detail page changed'))
+
+    # fields stored in the search index
+    INDEXED_FIELDS = ('name', 'author_name', 'description', 'readme', 'keywords', 'type', 'user_type', 'license',
+                      'last_push')
+    # fields listed in the catalog api
+    CATALOG_FIELDS = ('name', 'display_name', 'description', 'type', 'keywords', 'author_name', 'author_homepage',
+                      'license', 'files', 'has_package_file', 'last_commit_id', 'last_push')
+    # stars only change the index with the suggestion weight
+    tracker = FieldTracker(fields=sorted(set(INDEXED_FIELDS + CATALOG_FIELDS + ('stargazers_count',))))
 
     def get_url(self):
         return '{owner_url}/{name}'.format(owner_url=self.get_owner_url(), name=self.name)
@@ -96,9 +112,9 @@ class Repository(TimeStampedModel):
             return self.last_commit_id[:7]
         return ''
 
-    def update(self):
+    def update(self, force=False):
         from haindex.common.util.updater import RepositoryUpdater
-        RepositoryUpdater(repository=self).update()
+        RepositoryUpdater(repository=self).update(force=force)
 
     def __str__(self):
         return self.get_name()
@@ -107,6 +123,10 @@ class Repository(TimeStampedModel):
         verbose_name = _('Repository')
         verbose_name_plural = _('Repositories')
         unique_together = ('user', 'name')
+        indexes = [
+            GinIndex(fields=['search_vector'], name='haindex_repository_search_gin'),
+            GinIndex(fields=['name'], name='haindex_repository_name_trgm', opclasses=['gin_trgm_ops']),
+        ]
 
 
 class RepositoryRelease(TimeStampedModel):
@@ -127,3 +147,85 @@ class RepositoryRelease(TimeStampedModel):
         verbose_name_plural = _('Repository releases')
         unique_together = ('repository', 'tag_name')
         ordering = ('repository', '-published_at')
+
+
+class RepositoryDependencyPath(models.Model):
+    """
+    transitive closure of repository dependencies, depth is the longest known path
+    """
+    ancestor = models.ForeignKey(to='haindex.Repository', on_delete=models.CASCADE, related_name='dependency_paths',
+                                 verbose_name=_('Ancestor'))
+    descendant = models.ForeignKey(to='haindex.Repository', on_delete=models.CASCADE, related_name='dependent_paths',
+                                   verbose_name=_('Descendant'))
+    depth = models.PositiveIntegerField(verbose_name=_('Depth'))
+
+    def __str__(self):
+        return '{} -> {} ({})'.format(self.ancestor_id, self.descendant_id, self.depth)
+
+    class Meta:
+        verbose_name = _('Repository dependency path')
+        verbose_name_plural = _('Repository dependency paths')
+        unique_together = ('ancestor', 'descendant')
+
+
+class SearchIndexQueue(models.Model):
+    """
+    repositories waiting to be written to or removed from the search index
+    """
+    repository_id = models.IntegerField(unique=True, verbose_name=_('Repository ID'))
+    queued = models.DateTimeField(auto_now_add=True, verbose_name=_('Queued'))
+    # entries rejected by the search index are retried with a growing delay
+    attempts = models.IntegerField(default=0, verbose_name=_('Attempts'))
+    retry_after = models.DateTimeField(null=True, blank=True, verbose_name=_('Retry after'))
+
+    def __str__(self):
+        return str(self.repository_id)
+
+    class Meta:
+        verbose_name = _('Search index queue entry')
+        verbose_name_plural = _('Search index queue')
+
+
+class WebhookDelivery(TimeStampedModel):
+    delivery_id = models.CharField(max_length=50, unique=True, verbose_name=_('Delivery ID'))
+    event = models.CharField(max_length=50, verbose_name=_('Event'))
+    payload = models.TextField(verbose_name=_('Payload'))
+    processed = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name=_('Processed'))
+
+    def __str__(self):
+        return '{} ({})'.format(self.event, self.delivery_id)
+
+    class Meta:
+        verbose_name = _('Webhook delivery')
+        verbose_name_plural = _('Webhook deliveries')
+        ordering = ('id',)
+
+
+class ExtensionCounter(models.Model):
+    """
+    number of repositories by extension type, maintained on every change to avoid counting on each request
+    """
+    type = models.IntegerField(choices=Repository.TYPE_CHOICES, unique=True, verbose_name=_('Extension type'))
+    count = models.IntegerField(default=0, verbose_name=_('Count'))
+
+    def __str__(self):
+        return '{}: {}'.format(self.get_type_display(), self.count)
+
+    class Meta:
+        verbose_name = _('Extension counter')
+        verbose_name_plural = _('Extension counters')
+
+
+class Counter(models.Model):
+    """
+    named counter, changed with atomic updates as the database cache can't increment atomically
+    """
+    name = models.CharField(max_length=100, unique=True, verbose_name=_('Name'))
+    value = models.BigIntegerField(default=0, verbose_name=_('Value'))
+
+    def __str__(self):
+        return '{}: {}'.format(self.name, self.value)
+
+    class Meta:
+        verbose_name = _('Counter')
+        verbose_name_plural = _('Counters')
@@ -24,12 +24,25 @@ env = environ.Env(
     DEBUG=(bool, False),
     SECRET_KEY=(str, "addSecretKeyToEnvironment"),
     DJANGO_LOG_LEVEL=(str, 'WARNING'),
+    QUERY_BUDGET_HEADERS=(bool, None),
     ELASTIC_HOST=(str, ''),
+    SEARCH_BACKEND=(str, ''),
+    SEARCH_REINDEX_WORKERS=(int, 4),
+    CACHE_URL=(str, 'dbcache://haindex_cache?max_entries=50000'),
+    GITHUB_CACHE_URL=(str, 'dbcache://haindex_github_cache?max_entries=100000'),
+    SEARCH_CACHE_URL=(str, 'dbcache://haindex_search_cache?max_entries=10000'),
     GITHUB_API_USER=(str, ''),
     GITHUB_API_TOKEN=(str, ''),
+    GITHUB_API_TOKENS=(list, []),
+    GITHUB_RATE_LIMIT_RESERVE=(int, 100),
     GITHUB_WEBHOOK_SECRET=(str, ''),
     GITHUB_WEBHOOK_ENABLED=(bool, False),
     CELERY_BROKER_URL=(str, ''),
+    UPDATE_FAN_OUT_CHUNK_SIZE=(int, 50),
+    UPDATE_FAN_OUT_WINDOW=(int, 60 * 60 * 4),
+    UPDATE_DEBOUNCE=(int, 60),
+    UPDATE_LOCK_TIMEOUT=(int, 60 * 15),
+    README_RENDER_PROCESSES=(int, 0),
     RECAPTCHA_PUBLIC_KEY=(str, ''),
     RECAPTCHA_PRIVATE_KEY=(str, ''),
     SOCIAL_AUTH_GITHUB_KEY=(str, ''),
@@ -63,6 +76,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'django.contrib.sites',
     'django.contrib.flatpages',
+    'django.contrib.postgres',
 
     # own apps here
     'haindex.apps.HAIndexConfig',
@@ -85,6 +99,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'haindex.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'haindex.urls'
@@ -127,6 +142,18 @@ if 'TRAVIS' in os.environ:
 else:
     DATABASES = {'default': env.db()}
 
+# Caches
+
+# the database caches cull a third of their entries beyond max_entries (300 unless configured in the url),
+# the default cache holds update locks and fragments per repository, the github cache a few responses per repository,
+# both must hold them for the whole index. search results of old index generations are never read again, they are kept
+# apart so culling them doesn't evict locks. counters live in the database as database caches can't increment atomically
+CACHES = {
+    'default': env.cache('CACHE_URL'),
+    'github': env.cache('GITHUB_CACHE_URL'),
+    'search': env.cache('SEARCH_CACHE_URL'),
+}
+
 # Logging
 
 LOGGING_DEFAULT_HANDLERS = ['console']
@@ -165,9 +192,27 @@ LOGGING = {
             'level': LOGGING_LOG_LEVEL,
             'propagate': False,
         },
+        'haindex': {
+            'handlers': LOGGING_DEFAULT_HANDLERS,
+            'level': LOGGING_LOG_LEVEL,
+            'propagate': False,
+        },
     },
 }
 
+# maximum number of sql queries by view name with empty caches, requests exceeding them are logged
+QUERY_BUDGETS = {
+    'haindex_index': 4,
+    'haindex_extension_search': 12,
+    'haindex_extension_autocomplete': 3,
+    'haindex_extension_resolve': 4,
+    'haindex_extension_detail': 10,
+    'haindex_github_callback': 5,
+}
+
+# add X-Query-Count and X-Query-Time headers to responses, enabled in debug mode by default
+QUERY_BUDGET_HEADERS = env('QUERY_BUDGET_HEADERS') if env('QUERY_BUDGET_HEADERS') is not None else DEBUG
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -225,6 +270,45 @@ ELASTICSEARCH_DSL={
     },
 }
 
+# changed repositories are queued and written to the index in bulk after a delay (seconds)
+ELASTICSEARCH_DSL_AUTOSYNC = False
+SEARCH_INDEX_FLUSH_DELAY = 5
+
+# search backend, elasticsearch or postgres, defaults to elasticsearch if a host is configured
+SEARCH_BACKEND = env('SEARCH_BACKEND') or ('elasticsearch' if env('ELASTIC_HOST') else 'postgres')
+
+# number of threads sending bulk requests while building a new search index
+SEARCH_REINDEX_WORKERS = env('SEARCH_REINDEX_WORKERS')
+
+# seconds after which an unfinished reindex no longer holds back queued index updates
+SEARCH_REINDEX_TIMEOUT = 60 * 60 * 6
+
+# seconds to search the database before trying an unavailable elasticsearch again
+SEARCH_FALLBACK_TIMEOUT = 30
+
+# fuzzy matching is only used if exact matching finds less results
+SEARCH_MIN_HITS = 5
+
+# search results are cached per index generation, every index update starts a new generation
+SEARCH_CACHE = 'search'
+SEARCH_CACHE_TIMEOUT = 60 * 60 * 24
+
+# seconds a process keeps using the search index generation before reading it again
+SEARCH_GENERATION_INTERVAL = 5
+
+# cached fragments of repository detail pages are keyed by the last change of the repository
+DETAIL_CACHE_TIMEOUT = 60 * 60 * 24
+
+# seconds to cache the number of repositories in the listing without search term
+PAGINATION_COUNT_TIMEOUT = 60 * 5
+
+# seconds clients may use the catalog api response before revalidating it
+CATALOG_MAX_AGE = 60 * 5
+
+# search as you type suggestions
+AUTOCOMPLETE_SIZE = 10
+AUTOCOMPLETE_MAX_AGE = 60
+
 # app related
 
 CELERY_BROKER_URL = env('CELERY_BROKER_URL')
@@ -241,14 +325,36 @@ CELERY_SEND_EVENTS = False
 CELERY_SEND_TASK_SENT_EVENT = False
 CELERY_EVENT_QUEUE_TTL = 60
 
+# nightly repository updates are sent in chunks, spread over a window of seconds
+UPDATE_FAN_OUT_CHUNK_SIZE = env('UPDATE_FAN_OUT_CHUNK_SIZE')
+UPDATE_FAN_OUT_WINDOW = env('UPDATE_FAN_OUT_WINDOW')
+
+# repository update requests within the debounce window (seconds) are coalesced into a single task
+UPDATE_DEBOUNCE = env('UPDATE_DEBOUNCE')
+UPDATE_LOCK_TIMEOUT = env('UPDATE_LOCK_TIMEOUT')
+
+# number of processes rendering readmes next to the update loop, 0 renders inline
+# (process pools are not available in prefork celery workers)
+README_RENDER_PROCESSES = env('README_RENDER_PROCESSES')
+
+# webhook deliveries are collected in an inbox and processed in batches after a delay (seconds)
+WEBHOOK_BATCH_DELAY = 10
+
 BOOTSTRAP3 = {'horizontal_label_class': 'col-md-2', 'horizontal_field_class': 'col-md-10', 'success_css_class': ''}
 
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
 GITHUB_API_USER = env('GITHUB_API_USER')
 GITHUB_API_TOKEN = env('GITHUB_API_TOKEN')
+GITHUB_API_TOKENS = env('GITHUB_API_TOKENS')
+GITHUB_RATE_LIMIT_RESERVE = env('GITHUB_RATE_LIMIT_RESERVE')
 GITHUB_WEBHOOK_SECRET = env('GITHUB_WEBHOOK_SECRET')
 GITHUB_WEBHOOK_ENABLED = env('GITHUB_WEBHOOK_ENABLED')
+GITHUB_CACHE = 'github'
+GITHUB_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+# cache hit and miss counts are collected per process and written to the database at most every n seconds
+METRICS_FLUSH_INTERVAL = 60
 
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.github.GithubOAuth2',
@@ -0,0 +1,65 @@
+# -*- coding: UTF-8 -*-
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from haindex.common.util.catalog import bump_catalog_version
+from haindex.common.util.counters import change_extension_count
+from haindex.common.util.detail import touch_repository_details
+from haindex.common.util.indexer import queue_index_update
+from haindex.documents import RepositoryDocument
+from haindex.models import Repository
+
+
+@receiver(post_save, sender=Repository)
+def queue_repository_index_update(sender, instance, created, **kwargs):
+    # only indexed fields and the suggestion weight are relevant for the search index
+    weight_changed = RepositoryDocument.get_suggest_weight(instance.tracker.previous('stargazers_count')) != \
+        RepositoryDocument.get_suggest_weight(instance.stargazers_count)
+    if created or weight_changed or any(instance.tracker.has_changed(field) for field in Repository.INDEXED_FIELDS):
+        queue_index_update([instance.id])
+
+
+@receiver(post_delete, sender=Repository)
+def queue_repository_index_delete(sender, instance, **kwargs):
+    queue_index_update([instance.id])
+
+
+@receiver(post_save, sender=Repository)
+def update_extension_count(sender, instance, created, **kwargs):
+    if created:
+        change_extension_count(instance.type, 1)
+    elif instance.tracker.has_changed('type'):
+        change_extension_count(instance.tracker.previous('type'), -1)
+        change_extension_count(instance.type, 1)
+
+
+@receiver(post_delete, sender=Repository)
+def decrease_extension_count(sender, instance, **kwargs):
+    change_extension_count(instance.type, -1)
+
+
+@receiver(pre_delete, sender=Repository)
+def touch_related_repository_details(sender, instance, **kwargs):
+    # detail pages listing the repository as fork, dependency or dependent
+    touch_repository_details(
+        {instance.parent_repository_id} |
+        set(instance.dependencies.values_list('id', flat=True)) |
+        set(instance.provider.values_list('id', flat=True))
+    )
+
+
+@receiver(post_save, sender=Repository)
+def update_catalog_version(sender, instance, created, **kwargs):
+    if not created and any(instance.tracker.has_changed(field) for field in Repository.CATALOG_FIELDS):
+        bump_catalog_version()
+
+
+@receiver(post_delete, sender=Repository)
+def update_catalog_version_on_delete(sender, instance, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(m2m_changed, sender=Repository.dependencies.through)
+def update_catalog_version_on_dependency_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_catalog_version()
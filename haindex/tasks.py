@@ -1,32 +1,153 @@
 # -*- coding: UTF-8 -*-
+import math
+from functools import wraps
+
 from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.core.cache import cache
+from github import RateLimitExceededException
 
+from haindex.common.util.counters import reconcile_extension_counters
+from haindex.common.util.github import TokenPool, RateLimitExhausted
+from haindex.common.util.indexer import SearchIndexer
+from haindex.common.util.stats import RepositoryStatsUpdater
 from haindex.common.util.updater import RepositoryUpdater
+from haindex.common.util.webhook import WebhookProcessor
 from haindex import celery_app
 
 logger = get_task_logger(__name__)
 
+PENDING_KEY = 'haindex:repository:{kind}:pending:{id}'
+RUNNING_KEY = 'haindex:repository:update:running:{id}'
 
-@celery_app.task(autoretry_for=(Exception,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
-def update_repository(repository_id, *args, **kwargs):
-    from haindex.models import Repository
-    repository = Repository.objects.filter(id=repository_id).first()
-    if not repository:
+
+def defer_on_rate_limit(resource='core'):
+    """
+    re-schedule a bound task for the rate limit reset instead of retrying it right away
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return func(self, *args, **kwargs)
+            except (RateLimitExhausted, RateLimitExceededException) as e:
+                if isinstance(e, RateLimitExhausted):
+                    countdown = e.countdown
+                else:
+                    countdown = RateLimitExhausted(reset=TokenPool().get_reset(resource=resource)).countdown
+                logger.warning('GitHub rate limit exhausted, deferring %s by %d seconds', self.name, countdown)
+                self.apply_async(args=args, kwargs=kwargs, countdown=countdown)
+        return wrapper
+    return decorator
+
+
+def schedule_repository_update(repository_id):
+    """
+    queue a full repository update, requests during the debounce window fold into the pending one
+    """
+    pending_key = PENDING_KEY.format(kind='update', id=repository_id)
+    if cache.add(pending_key, True, timeout=settings.UPDATE_DEBOUNCE + settings.UPDATE_LOCK_TIMEOUT):
+        update_repository.apply_async([repository_id], countdown=settings.UPDATE_DEBOUNCE)
+
+
+def mark_repository_updates_pending(repository_ids, countdown):
+    """
+    set the pending markers of full updates sent with a countdown, returns the repositories that weren't pending yet
+    """
+    return [
+        repository_id for repository_id in sorted(repository_ids)
+        if cache.add(PENDING_KEY.format(kind='update', id=repository_id), True,
+                     timeout=countdown + settings.UPDATE_LOCK_TIMEOUT)
+    ]
+
+
+def schedule_repository_updates(repository_ids):
+    """
+    queue full updates of many repositories as a single task, skipping the ones already pending
+    """
+    scheduled_ids = mark_repository_updates_pending(repository_ids, countdown=settings.UPDATE_DEBOUNCE)
+    if scheduled_ids:
+        update_repositories.apply_async([scheduled_ids], countdown=settings.UPDATE_DEBOUNCE)
+
+
+def schedule_repository_stats_update(repository_id):
+    """
+    queue a repository stats update unless a stats or full update is pending already
+    """
+    if cache.get(PENDING_KEY.format(kind='update', id=repository_id)):
         return
-    repository.update()
+    pending_key = PENDING_KEY.format(kind='stats', id=repository_id)
+    if cache.add(pending_key, True, timeout=settings.UPDATE_DEBOUNCE + settings.UPDATE_LOCK_TIMEOUT):
+        update_repository_stats.apply_async([repository_id], countdown=settings.UPDATE_DEBOUNCE)
 
 
-@celery_app.task(autoretry_for=(Exception,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
-def update_repository_stats(repository_id, *args, **kwargs):
+def run_exclusive_update(repository):
+    """
+    run a full repository update unless another one is running, returns whether the update ran
+    """
+    running_key = RUNNING_KEY.format(id=repository.id)
+    if not cache.add(running_key, True, timeout=settings.UPDATE_LOCK_TIMEOUT):
+        return False
+    try:
+        cache.delete(PENDING_KEY.format(kind='update', id=repository.id))
+        repository.update()
+    finally:
+        cache.delete(running_key)
+    return True
+
+
+@celery_app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
+@defer_on_rate_limit()
+def update_repository(self, repository_id, *args, **kwargs):
     from haindex.models import Repository
     repository = Repository.objects.filter(id=repository_id).first()
     if not repository:
         return
-    RepositoryUpdater(repository=repository).update_stats()
 
+    # another update is running, check again once it's done
+    if not run_exclusive_update(repository):
+        self.apply_async([repository_id], countdown=settings.UPDATE_DEBOUNCE)
 
-@celery_app.task(autoretry_for=(Exception,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
-def subscribe_repository(repository_id, *args, **kwargs):
+
+@celery_app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
+@defer_on_rate_limit()
+def update_repositories(self, repository_ids, *args, **kwargs):
+    from haindex.models import Repository
+    locked_ids = []
+    for repository in Repository.objects.filter(id__in=repository_ids).order_by('id'):
+        # a single failing repository must not retry the whole chunk
+        try:
+            if not run_exclusive_update(repository):
+                locked_ids.append(repository.id)
+        except (RateLimitExhausted, RateLimitExceededException):
+            raise
+        except Exception as e:
+            logger.exception(e)
+
+    # another update is running, their pending markers stay until these ones ran
+    if locked_ids:
+        self.apply_async([locked_ids], countdown=settings.UPDATE_DEBOUNCE)
+
+
+@celery_app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
+@defer_on_rate_limit(resource='graphql')
+def update_repository_stats(self, repository_id, *args, **kwargs):
+    cache.delete(PENDING_KEY.format(kind='stats', id=repository_id))
+    RepositoryStatsUpdater().update([repository_id])
+
+
+@celery_app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
+@defer_on_rate_limit(resource='graphql')
+def update_all_repository_stats(self, *args, **kwargs):
+    from haindex.models import Repository
+    repositories = Repository.objects.order_by('id').values_list('id', 'user__username', 'name')
+    updated = RepositoryStatsUpdater().update_many(repositories.iterator())
+    logger.info('Updated stats of %d repositories', updated)
+
+
+@celery_app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
+@defer_on_rate_limit()
+def subscribe_repository(self, repository_id, *args, **kwargs):
     from haindex.models import Repository
     repository = Repository.objects.filter(id=repository_id).first()
     if not repository:
@@ -34,8 +155,59 @@ def subscribe_repository(repository_id, *args, **kwargs):
     RepositoryUpdater(repository=repository).subscribe()
 
 
+@celery_app.task(autoretry_for=(Exception,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
+def process_webhook_deliveries(*args, **kwargs):
+    processed = WebhookProcessor().process_all()
+    if processed:
+        logger.info('Processed %d webhook deliveries', processed)
+
+
+@celery_app.task(autoretry_for=(Exception,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
+def flush_search_index_queue(*args, **kwargs):
+    processed = SearchIndexer().flush_all()
+    if processed:
+        logger.info('Flushed %d repositories to the search index', processed)
+
+
+@celery_app.task(autoretry_for=(Exception,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
+def update_extension_counters(*args, **kwargs):
+    corrected = reconcile_extension_counters()
+    if corrected:
+        logger.info('Corrected extension counters of types %s', corrected)
+
+
 @celery_app.task(autoretry_for=(Exception,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
 def fan_out_update_repository_tasks(*args, **kwargs):
     from haindex.models import Repository
-    for repository in Repository.objects.filter(user__usersocialauth__isnull=True):
-        update_repository.apply_async([repository.id])
+    repository_ids = Repository.objects.filter(
+        user__usersocialauth__isnull=True).order_by('id').values_list('id', flat=True)
+
+    # spread chunks evenly over the dispatch window
+    chunk_size = settings.UPDATE_FAN_OUT_CHUNK_SIZE
+    chunk_count = math.ceil(repository_ids.count() / chunk_size)
+    interval = settings.UPDATE_FAN_OUT_WINDOW / chunk_count if chunk_count else 0
+
+    chunks = 0
+    scheduled = 0
+
+    def send(chunk):
+        # repositories with a pending update are updated by that one
+        countdown = int(chunks * interval)
+        chunk = mark_repository_updates_pending(chunk, countdown=countdown)
+        if chunk:
+            update_repositories.apply_async([chunk], countdown=countdown)
+        return len(chunk)
+
+    chunk = []
+    for repository_id in repository_ids.iterator(chunk_size=2000):
+        chunk.append(repository_id)
+        if len(chunk) >= chunk_size:
+            scheduled += send(chunk)
+            chunks += 1
+            chunk = []
+    if chunk:
+        scheduled += send(chunk)
+        chunks += 1
+
+    logger.info('Scheduled %d repository updates in %d chunks', scheduled, chunks)
+    return {'chunks': chunks, 'repositories': scheduled}
@@ -0,0 +1,67 @@
+# -*- coding: UTF-8 -*-
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from haindex.models import Repository
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'haindex-tests'},
+    'github': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'haindex-tests-github'},
+    'search': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'haindex-tests-search'},
+}
+
+
+def clear_caches():
+    for alias in LOCMEM_CACHES:
+        caches[alias].clear()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SimpleCacheTestCase(SimpleTestCase):
+    """
+    test without database, every test starts with empty local memory caches
+    """
+
+    def setUp(self):
+        super().setUp()
+        clear_caches()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CacheTestCase(TestCase):
+    """
+    database test, every test starts with empty local memory caches
+    """
+
+    def setUp(self):
+        super().setUp()
+        clear_caches()
+
+
+class RepositoryTestCase(CacheTestCase):
+    """
+    database test on the example repositories
+    """
+    fixtures = ['repositories.json']
+
+    @classmethod
+    def create_repositories(cls, count, user=None, **values):
+        """
+        bulk create repositories named repository0 to repositoryN, each with its own user unless one is given
+
+        values may be callables getting the index of the repository
+        """
+        if user is None:
+            users = get_user_model().objects.bulk_create([
+                get_user_model()(username='user{}'.format(index), password='!') for index in range(count)
+            ])
+        else:
+            users = [user] * count
+
+        repositories = []
+        for index in range(count):
+            fields = {'user': users[index], 'name': 'repository{}'.format(index)}
+            fields.update({field: value(index) if callable(value) else value for field, value in values.items()})
+            repositories.append(Repository(**fields))
+        return Repository.objects.bulk_create(repositories)
@@ -0,0 +1,35 @@
+# -*- coding: UTF-8 -*-
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase
+from django.urls import reverse
+
+from haindex import views
+
+
+class AcceptsGzipTests(SimpleTestCase):
+
+    def accepts_gzip(self, accept_encoding):
+        return views.accepts_gzip(RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding))
+
+    def test_accepted(self):
+        self.assertTrue(self.accepts_gzip('gzip'))
+        self.assertTrue(self.accepts_gzip('deflate, GZIP;q=0.5'))
+
+    def test_refused(self):
+        self.assertFalse(self.accepts_gzip(''))
+        self.assertFalse(self.accepts_gzip('gzip;q=0'))
+        self.assertFalse(self.accepts_gzip('gzip; q=0.0, br'))
+        self.assertFalse(self.accepts_gzip('x-gzip2'))
+
+
+@mock.patch.object(views, 'get_catalog_version', return_value=7)
+class CatalogViewTests(SimpleTestCase):
+
+    def test_not_modified_has_caching_headers(self, get_catalog_version):
+        response = self.client.get(reverse('haindex_api_extensions', kwargs={'format': 'json'}),
+                                   HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH='"7-json-gzip"')
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
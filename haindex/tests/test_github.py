@@ -0,0 +1,30 @@
+# -*- coding: UTF-8 -*-
+import time
+
+from django.test import override_settings
+
+from haindex.common.util.github import RateLimitExhausted, TokenPool
+from haindex.tests import SimpleCacheTestCase
+
+
+@override_settings(GITHUB_API_TOKEN='', GITHUB_API_TOKENS=[], GITHUB_RATE_LIMIT_RESERVE=100)
+class TokenPoolTests(SimpleCacheTestCase):
+
+    def test_without_tokens_falls_back_to_unauthenticated_requests(self):
+        with self.assertLogs('haindex.common.util.github', level='ERROR'):
+            self.assertIsNone(TokenPool().get_token())
+
+    def test_picks_token_with_most_headroom(self):
+        reset = int(time.time()) + 600
+        pool = TokenPool()
+        pool.record('a', {'X-RateLimit-Remaining': '200', 'X-RateLimit-Reset': str(reset)})
+        pool.record('b', {'X-RateLimit-Remaining': '3000', 'X-RateLimit-Reset': str(reset)})
+        self.assertEqual(pool.get_token(tokens=['a', 'b']), 'b')
+
+    def test_raises_once_all_tokens_are_exhausted(self):
+        reset = int(time.time()) + 600
+        pool = TokenPool()
+        pool.record('a', {'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': str(reset)})
+        with self.assertRaises(RateLimitExhausted) as context:
+            pool.get_token(tokens=['a'])
+        self.assertEqual(context.exception.reset, reset)
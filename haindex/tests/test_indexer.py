@@ -0,0 +1,127 @@
+# -*- coding: UTF-8 -*-
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from elasticsearch.exceptions import ConnectionError
+
+from haindex.common.util import indexer
+from haindex.common.util.indexer import SearchIndexer, queue_index_update
+from haindex.documents import RepositoryDocument
+from haindex.models import SearchIndexQueue
+from haindex.tests import RepositoryTestCase
+
+REJECTED = {'index': {'_id': '2', 'status': 400, 'error': {'type': 'mapper_parsing_exception'}}}
+NOT_FOUND = {'delete': {'_id': '4', 'status': 404}}
+
+
+@override_settings(SEARCH_BACKEND='elasticsearch')
+@mock.patch.object(RepositoryDocument, 'prepare', return_value={})
+class SearchIndexerTests(RepositoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        SearchIndexQueue.objects.all().delete()
+        # repository 4 doesn't exist and is removed from the index
+        queue_index_update([1, 2, 3, 4])
+
+    def test_rejected_document_is_retried_later(self, prepare):
+        with mock.patch.object(indexer, 'bulk', return_value=(2, [REJECTED, NOT_FOUND])) as bulk:
+            self.assertEqual(SearchIndexer().flush(), 4)
+            self.assertEqual({action['_id'] for action in bulk.call_args[0][1]}, {1, 2, 3, 4})
+
+            entry = SearchIndexQueue.objects.get()
+            self.assertEqual(entry.repository_id, 2)
+            self.assertEqual(entry.attempts, 1)
+            self.assertGreater(entry.retry_after, timezone.now())
+
+            # the rejected repository doesn't hold up the queue
+            queue_index_update([3])
+            bulk.return_value = (1, [])
+            self.assertEqual(SearchIndexer().flush_all(), 1)
+            self.assertEqual(list(SearchIndexQueue.objects.values_list('repository_id', flat=True)), [2])
+
+    def test_rejected_document_is_dropped_after_max_attempts(self, prepare):
+        SearchIndexQueue.objects.exclude(repository_id=2).delete()
+        SearchIndexQueue.objects.update(attempts=SearchIndexer.MAX_ATTEMPTS - 1)
+        with mock.patch.object(indexer, 'bulk', return_value=(0, [REJECTED])), self.assertLogs(
+                'haindex.common.util.indexer', level='ERROR'):
+            self.assertEqual(SearchIndexer().flush(), 1)
+        self.assertFalse(SearchIndexQueue.objects.exists())
+
+    def test_unavailable_index_keeps_queue(self, prepare):
+        with mock.patch.object(indexer, 'bulk', side_effect=ConnectionError('N/A', 'unavailable', None)):
+            self.assertEqual(SearchIndexer().flush(), 0)
+        self.assertEqual(SearchIndexQueue.objects.count(), 4)
+        self.assertFalse(SearchIndexQueue.objects.filter(attempts__gt=0).exists())
+
+
+@override_settings(SEARCH_BACKEND='elasticsearch')
+class SearchReindexerTests(RepositoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        SearchIndexQueue.objects.all().delete()
+        patcher = mock.patch.object(indexer.connections, 'get_connection')
+        self.client = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.return_value.indices.exists_alias.return_value = False
+        self.client.return_value.indices.exists.return_value = False
+        patcher = mock.patch.object(indexer, 'search_index')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_changes_during_bulk_load_are_replayed_before_swap(self):
+        indexed = []
+
+        def index(name, queryset):
+            ids = set(queryset.values_list('id', flat=True))
+            indexed.append(ids)
+            if len(indexed) == 1:
+                # repository 2 changes and repository 4 is deleted while the bulk load runs
+                queue_index_update([2, 4])
+                self.assertTrue(indexer.is_reindexing())
+                self.assertEqual(SearchIndexer().flush(), 0)
+            return ids
+
+        with mock.patch.object(indexer.SearchReindexer, '_index', side_effect=index), \
+                mock.patch.object(indexer, 'bulk') as bulk:
+            name, count = indexer.SearchReindexer(alias='test-haindex').reindex()
+
+        self.assertEqual(count, 3)
+        self.assertEqual(indexed, [{1, 2, 3}, {2}])
+        self.assertEqual([action['_id'] for action in bulk.call_args[0][1]], [4])
+        self.assertEqual(bulk.call_args[0][1][0]['_index'], name)
+        self.assertFalse(indexer.is_reindexing())
+
+        # the queue is written to the swapped alias by the next flush
+        self.assertEqual(set(SearchIndexQueue.objects.values_list('repository_id', flat=True)), {2, 4})
+
+
+class SwapAliasTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(indexer.connections, 'get_connection')
+        self.indices = patcher.start().return_value.indices
+        self.addCleanup(patcher.stop)
+
+    def test_moves_existing_alias(self):
+        self.indices.exists_alias.return_value = True
+        self.indices.get_alias.return_value = {'haindex-1': {}}
+        indexer.SearchReindexer()._swap_alias('haindex-2')
+        self.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'add': {'index': 'haindex-2', 'alias': 'haindex'}},
+            {'remove': {'index': 'haindex-1', 'alias': 'haindex'}},
+        ]})
+        self.indices.delete.assert_called_once_with(index='haindex-1')
+
+    def test_replaces_concrete_index_atomically(self):
+        self.indices.exists_alias.return_value = False
+        self.indices.exists.return_value = True
+        with self.assertLogs('haindex.common.util.indexer', level='WARNING'):
+            indexer.SearchReindexer()._swap_alias('haindex-2')
+        self.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'add': {'index': 'haindex-2', 'alias': 'haindex'}},
+            {'remove_index': {'index': 'haindex'}},
+        ]})
+        self.indices.delete.assert_not_called()
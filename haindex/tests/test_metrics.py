@@ -0,0 +1,31 @@
+# -*- coding: UTF-8 -*-
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from haindex.common.util import metrics
+
+
+@override_settings(METRICS_FLUSH_INTERVAL=60 * 60)
+@mock.patch.object(metrics, 'increment_counter')
+class MetricsTests(SimpleTestCase):
+
+    def tearDown(self):
+        metrics._pending.clear()
+
+    def test_increments_are_written_in_one_update(self, increment_counter):
+        metrics.increment('test_hit')
+        metrics.increment('test_hit', 2)
+        increment_counter.assert_not_called()
+
+        self.assertEqual(metrics.flush(), 1)
+        increment_counter.assert_called_once_with('metric:test_hit', 3)
+
+    @override_settings(METRICS_FLUSH_INTERVAL=0)
+    def test_flush_after_interval(self, increment_counter):
+        metrics.increment('test_miss')
+        increment_counter.assert_called_once_with('metric:test_miss', 1)
+
+    def test_format_cache_stats(self, increment_counter):
+        self.assertEqual(metrics.format_cache_stats(hits=3, misses=1), 'hits: 3\nmisses: 1\nhit ratio: 75.0%')
+        self.assertEqual(metrics.format_cache_stats(hits=0, misses=0), 'hits: 0\nmisses: 0\nhit ratio: 0.0%')
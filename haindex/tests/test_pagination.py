@@ -0,0 +1,93 @@
+# -*- coding: UTF-8 -*-
+import base64
+import json
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from haindex.common.util.pagination import InvalidCursor, LastPushPaginator
+from haindex.models import Repository
+from haindex.tests import RepositoryTestCase
+
+
+def make_cursor(direction, last_push, id):
+    return base64.urlsafe_b64encode(json.dumps([direction, last_push, id]).encode('utf-8')).decode('ascii')
+
+
+class LastPushPaginatorTests(RepositoryTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        # equal pushes and repositories without push on page boundaries
+        cls.create_repositories(30, user=get_user_model().objects.get(id=1),
+                                last_push=lambda index: None if index % 4 == 0 else now - timedelta(days=index // 3))
+
+    def get_expected_ids(self):
+        minimum = datetime.min.replace(tzinfo=timezone.utc)
+        return [repository.id for repository in sorted(
+            Repository.objects.all(), key=lambda repository: (repository.last_push or minimum, repository.id),
+            reverse=True)]
+
+    def test_pages_follow_listing_order(self):
+        paginator = LastPushPaginator(Repository.objects.all(), page_size=7)
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([repository.id for page in pages for repository in page.object_list],
+                         self.get_expected_ids())
+        self.assertFalse(pages[0].has_previous())
+
+        # and back again
+        previous_pages = [pages[-1]]
+        while previous_pages[-1].has_previous():
+            previous_pages.append(paginator.get_page(previous_pages[-1].previous_cursor))
+        self.assertEqual([[repository.id for repository in page.object_list] for page in reversed(previous_pages)],
+                         [[repository.id for repository in page.object_list] for page in pages])
+
+    def test_cursor_at_offset(self):
+        paginator = LastPushPaginator(Repository.objects.all(), page_size=7)
+        page = paginator.get_page(paginator.get_cursor_at(14))
+        self.assertEqual([repository.id for repository in page.object_list], self.get_expected_ids()[14:21])
+        self.assertIsNone(paginator.get_cursor_at(0))
+        with self.assertRaises(InvalidCursor):
+            paginator.get_cursor_at(100)
+
+    def test_invalid_cursors(self):
+        for cursor in ('garbage', make_cursor('next', 'yesterday', 1), make_cursor('next', None, '1'),
+                       make_cursor('sideways', None, 1)):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                LastPushPaginator.decode_cursor(cursor)
+
+    def test_uses_index(self):
+        paginator = LastPushPaginator(Repository.objects.all(), page_size=7)
+        direction, last_push, id = paginator.decode_cursor(paginator.get_page().next_cursor)
+        with connection.cursor() as cursor:
+            # the few test rows would be read sequentially otherwise
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_bitmapscan = off')
+        for queryset in (paginator.queryset, paginator._filter(paginator.queryset, '<', last_push, id),
+                         paginator._filter(paginator.queryset.reverse(), '>', last_push, id)):
+            plan = queryset[:8].explain()
+            self.assertIn('haindex_repository_push_key_id', plan)
+            self.assertNotIn('Sort', plan)
+
+
+class RepositoryListingTests(RepositoryTestCase):
+
+    def test_malformed_cursor(self):
+        response = self.client.get('{}?{}'.format(reverse('haindex_extension_search'), urlencode({
+            'cursor': make_cursor('next', 'yesterday', 1)})))
+        self.assertEqual(response.status_code, 404)
+
+    def test_numbered_page_redirects_to_cursor(self):
+        url = reverse('haindex_extension_search')
+        response = self.client.get('{}?{}'.format(url, urlencode({'page': 1, 'type': 'lovelace'})))
+        self.assertRedirects(response, '{}?{}'.format(url, urlencode({'type': 'lovelace'})))
+
+        response = self.client.get('{}?{}'.format(url, urlencode({'page': 2})))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,108 @@
+# -*- coding: UTF-8 -*-
+import hmac
+import json
+from datetime import timedelta
+from hashlib import sha1
+from unittest import mock
+
+from django.conf import settings
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from haindex.common.util.indexer import update_search_vectors
+from haindex.common.util.queries import QueryCounter
+from haindex.models import Repository
+from haindex.tests import RepositoryTestCase
+
+# more than two pages of the listing, a third of them forks of the first example repository
+CLONES = 45
+FORKS = 15
+DEPENDENCIES = 5
+
+
+@override_settings(SEARCH_BACKEND='postgres', GITHUB_WEBHOOK_SECRET='secret')
+class QueryBudgetTests(RepositoryTestCase):
+    """
+    the main views must stay within their query budgets, independent of the number of rows they list
+
+    caches are empty, the budgets count the database queries of a cold request
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.repository = Repository.objects.select_related('user').get(id=1)
+        excluded = ('id', 'user', 'parent_repository', 'last_push', 'created', 'modified', 'search_vector')
+        values = {
+            field.name: getattr(cls.repository, field.name) for field in Repository._meta.concrete_fields
+            if field.name not in excluded
+        }
+        now = timezone.now()
+        clones = cls.create_repositories(
+            CLONES,
+            parent_repository=lambda index: cls.repository if index < FORKS else None,
+            # some repositories have never been pushed to
+            last_push=lambda index: None if index % 10 == 0 else now - timedelta(hours=index),
+            **values)
+        cls.repository.dependencies.add(*clones[-DEPENDENCIES:])
+        update_search_vectors()
+
+    def assertWithinBudget(self, view_name, url, method='get', **kwargs):
+        with QueryCounter() as counter:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        budget = settings.QUERY_BUDGETS[view_name]
+        self.assertLessEqual(counter.count, budget, '{url} ran {count} queries, the budget of {view_name} is '
+                                                    '{budget}'.format(url=url, count=counter.count,
+                                                                      view_name=view_name, budget=budget))
+        return response
+
+    def test_index(self):
+        self.assertWithinBudget('haindex_index', reverse('haindex_index'))
+
+    def test_listing(self):
+        url = reverse('haindex_extension_search')
+        response = self.assertWithinBudget('haindex_extension_search', url)
+        self.assertEqual(len(response.context['results']), 20)
+
+        # follow the cursors to the last page, which lists the repositories without push
+        for page in range(2):
+            cursor = response.context['next_cursor']
+            self.assertTrue(cursor)
+            response = self.assertWithinBudget('haindex_extension_search', '{}?{}'.format(
+                url, urlencode({'cursor': cursor})))
+        self.assertIsNone(response.context['results'][len(response.context['results']) - 1].last_push)
+
+    def test_search(self):
+        url = '{}?{}'.format(reverse('haindex_extension_search'), urlencode({'search': 'calendar'}))
+        response = self.assertWithinBudget('haindex_extension_search', url)
+        self.assertEqual(len(response.context['results']), 20)
+
+        response = self.assertWithinBudget('haindex_extension_search', url + '&page=2')
+        self.assertEqual(len(response.context['results']), 20)
+
+    def test_detail(self):
+        response = self.assertWithinBudget('haindex_extension_detail', reverse('haindex_extension_detail', kwargs={
+            'user': self.repository.user.username, 'name': self.repository.name}))
+        # the example fork and the cloned ones
+        self.assertEqual(len(response.context['forks']), FORKS + 1)
+        self.assertEqual(len(response.context['dependencies']), DEPENDENCIES)
+
+    def test_autocomplete(self):
+        self.assertWithinBudget('haindex_extension_autocomplete', '{}?{}'.format(
+            reverse('haindex_extension_autocomplete'), urlencode({'q': 'cal'})))
+
+    def test_resolve(self):
+        self.assertWithinBudget('haindex_extension_resolve', '{}?{}'.format(
+            reverse('haindex_extension_resolve'), urlencode({'extension': self.repository.get_name()})))
+
+    @mock.patch('haindex.tasks.process_webhook_deliveries.apply_async')
+    def test_github_callback(self, apply_async):
+        payload = json.dumps({'repository': {'id': 1, 'full_name': self.repository.get_name()}})
+        signature = hmac.new(b'secret', msg=payload.encode('utf-8'), digestmod=sha1).hexdigest()
+        self.assertWithinBudget('haindex_github_callback', reverse('haindex_github_callback'), method='post',
+                                data=payload, content_type='application/json',
+                                HTTP_X_HUB_SIGNATURE='sha1={}'.format(signature), HTTP_X_GITHUB_EVENT='push',
+                                HTTP_X_GITHUB_DELIVERY='delivery')
+        apply_async.assert_called_once_with(countdown=settings.WEBHOOK_BATCH_DELAY)
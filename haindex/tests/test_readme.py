@@ -0,0 +1,31 @@
+# -*- coding: UTF-8 -*-
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from haindex.common.util import readme
+from haindex.common.util.readme import ReadmeRenderJob
+from haindex.tests import SimpleCacheTestCase
+
+
+@mock.patch.object(readme, 'render_html', return_value='<h1>Title</h1>')
+class ReadmeRenderJobTests(SimpleCacheTestCase):
+
+    def get_job(self, exception):
+        future = Future()
+        future.set_exception(exception)
+        return ReadmeRenderJob(cache_key='readme', future=future, content='# Title', extension='.md')
+
+    def test_renders_inline_if_worker_fails(self, render_html):
+        with self.assertLogs('haindex.common.util.readme', level='WARNING'):
+            html = self.get_job(ValueError('worker failed')).get_html()
+        render_html.assert_called_once_with('# Title', '.md')
+        self.assertEqual(html, '<h1>Title</h1>')
+
+    def test_drops_broken_pool(self, render_html):
+        pool = mock.Mock()
+        with mock.patch.object(readme, '_pool', pool), self.assertLogs('haindex.common.util.readme', level='WARNING'):
+            html = self.get_job(BrokenProcessPool()).get_html()
+            self.assertIsNone(readme._pool)
+        pool.shutdown.assert_called_once_with(wait=False)
+        self.assertEqual(html, '<h1>Title</h1>')
@@ -0,0 +1,149 @@
+# -*- coding: UTF-8 -*-
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from elasticsearch_dsl.connections import connections
+
+from haindex.common.util import search
+from haindex.common.util.indexer import update_search_vectors
+from haindex.common.util.search import DatabaseSearchResultList, SearchResultList, bump_generation, get_generation, \
+    normalize_term
+from haindex.documents import RepositoryDocument, search_index
+from haindex.models import Repository
+from haindex.tests import CacheTestCase, RepositoryTestCase
+
+TEST_INDEX = 'test-haindex'
+
+
+def is_elasticsearch_reachable():
+    if not settings.ELASTICSEARCH_DSL['default']['hosts']:
+        return False
+    try:
+        return connections.get_connection().ping()
+    except Exception:
+        return False
+
+
+class GenerationTests(CacheTestCase):
+
+    def test_bump_survives_cache_clear(self):
+        bump_generation()
+        bump_generation()
+        generation = get_generation()
+        cache.clear()
+        bump_generation()
+        self.assertEqual(get_generation(), generation + 1)
+
+
+@override_settings(SEARCH_GENERATION_INTERVAL=60)
+class GenerationIntervalTests(SimpleTestCase):
+
+    def setUp(self):
+        search._generation = None
+        self.addCleanup(setattr, search, '_generation', None)
+
+    @mock.patch.object(search, 'get_counter', return_value=3)
+    def test_generation_is_read_once_per_interval(self, get_counter):
+        self.assertEqual(get_generation(), 3)
+        self.assertEqual(get_generation(), 3)
+        get_counter.assert_called_once_with(search.GENERATION_COUNTER)
+
+    @mock.patch.object(search, 'increment_counter')
+    @mock.patch.object(search, 'get_counter', side_effect=[3, 4])
+    def test_bump_reads_the_generation_again(self, get_counter, increment_counter):
+        self.assertEqual(get_generation(), 3)
+        bump_generation()
+        self.assertEqual(get_generation(), 4)
+
+
+class DatabaseSearchTests(RepositoryTestCase):
+    """
+    relevance of the search backends on the example repositories
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        update_search_vectors()
+
+    def search(self, term, size=10, filters=None):
+        return [result.id for result in DatabaseSearchResultList(normalize_term(term), 0, size, filters=filters)[
+                0:size]]
+
+    def get_cases(self):
+        """
+        get (description, term, repository id, rank) cases, the repository must be found within the given rank
+        """
+        cases = []
+        for repository in Repository.objects.exclude(name='').select_related('user').order_by('id'):
+            name = repository.name
+            cases.append(('name', name, repository.id, 2))
+            cases.append(('owner and name', '{} {}'.format(repository.user.username, name), repository.id, 1))
+            cases.append(('name prefix', name[:max(4, len(name) // 2)], repository.id, 2))
+            # swap two characters after the first one
+            cases.append(('misspelled name', name[:2] + name[3] + name[2] + name[4:], repository.id, 2))
+            for keyword in (repository.keywords or [])[:1]:
+                cases.append(('keyword', keyword, repository.id, 1))
+        return cases
+
+    def test_finds_repositories(self):
+        for description, term, repository_id, rank in self.get_cases():
+            with self.subTest(description, term=term):
+                self.assertIn(repository_id, self.search(term, size=rank))
+
+    def test_ranks_name_and_owner_first(self):
+        self.assertEqual(self.search('tools')[0], 3)
+        self.assertEqual(self.search('thomasloven')[0], 3)
+        self.assertEqual(set(self.search('calendar')[:2]), {1, 2})
+
+    def test_filters_by_facet(self):
+        self.assertEqual(self.search('calendar', filters={'keyword': ['google']}), [2])
+        self.assertEqual(self.search('card', filters={'license': ['MIT']}), [2])
+
+    def test_counts_facets(self):
+        results = DatabaseSearchResultList('calendar', 0, 10)
+        keywords = {facet['name']: facet for facet in results.facets}['keyword']
+        self.assertEqual({bucket['value']: bucket['count'] for bucket in keywords['buckets']},
+                         {'google': 1, 'calendar': 1})
+
+
+@skipUnless(is_elasticsearch_reachable(), 'elasticsearch is not available')
+class ElasticsearchSearchTests(DatabaseSearchTests):
+    """
+    the same expectations for elasticsearch, run against a separate test index
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.index_patcher = mock.patch.object(RepositoryDocument._doc_type, 'index', TEST_INDEX)
+        cls.index_patcher.start()
+        search_index.clone(name=TEST_INDEX).create()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections.get_connection().indices.delete(index=TEST_INDEX, ignore=404)
+        cls.index_patcher.stop()
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        RepositoryDocument().update(RepositoryDocument().get_queryset(), refresh=True)
+
+    def search(self, term, size=10, filters=None):
+        return [result.id for result in SearchResultList(normalize_term(term), 0, size, filters=filters,
+                                                         fallback=False)[0:size]]
+
+    def test_counts_facets(self):
+        results = SearchResultList('calendar', 0, 10, fallback=False)
+        keywords = {facet['name']: facet for facet in results.facets}['keyword']
+        self.assertEqual({bucket['value']: bucket['count'] for bucket in keywords['buckets']},
+                         {'google': 1, 'calendar': 1})
+
+    def test_backends_agree(self):
+        for description, term, repository_id, rank in self.get_cases():
+            with self.subTest(description, term=term):
+                self.assertEqual(
+                    set(DatabaseSearchTests.search(self, term, size=rank)), set(self.search(term, size=rank)))
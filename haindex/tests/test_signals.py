@@ -0,0 +1,26 @@
+# -*- coding: UTF-8 -*-
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from haindex import signals
+from haindex.models import Repository
+
+
+class QueueRepositoryIndexUpdateTests(SimpleTestCase):
+
+    def get_instance(self, previous_stars, stars):
+        instance = mock.Mock(id=1, stargazers_count=stars)
+        instance.tracker.has_changed.return_value = False
+        instance.tracker.previous.return_value = previous_stars
+        return instance
+
+    @mock.patch.object(signals, 'queue_index_update')
+    def test_queues_suggest_weight_change(self, queue_index_update):
+        signals.queue_repository_index_update(Repository, self.get_instance(3, 40), created=False)
+        queue_index_update.assert_called_once_with([1])
+
+    @mock.patch.object(signals, 'queue_index_update')
+    def test_skips_stars_change_within_weight(self, queue_index_update):
+        signals.queue_repository_index_update(Repository, self.get_instance(40, 41), created=False)
+        queue_index_update.assert_not_called()
@@ -0,0 +1,38 @@
+# -*- coding: UTF-8 -*-
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from haindex.common.util import stats
+from haindex.models import Repository
+from haindex.tests import RepositoryTestCase, clear_caches
+
+
+class RepositoryStatsUpdaterTests(SimpleTestCase):
+
+    @override_settings(GITHUB_API_TOKEN='', GITHUB_API_TOKENS=[])
+    @mock.patch.object(stats, 'get_session')
+    def test_no_request_without_token(self, get_session):
+        self.assertEqual(stats.RepositoryStatsUpdater().update_many([(1, 'lociii', 'homeassistant-overlay')]), 0)
+        get_session.assert_not_called()
+
+
+class RepositoryStatsSaveTests(RepositoryTestCase):
+
+    def test_stats_change_detail_page(self):
+        repository = Repository.objects.select_related('user').get(id=1)
+        url = reverse('haindex_extension_detail', kwargs={'user': repository.user.username, 'name': repository.name})
+        etag = self.client.get(url)['ETag']
+
+        stats.RepositoryStatsUpdater()._save({repository.id: {
+            'stargazers_count': (repository.stargazers_count or 0) + 1,
+            'forks_count': repository.forks_count,
+            'issues_count': repository.issues_count,
+            'last_push': repository.last_push,
+        }})
+        self.assertGreater(Repository.objects.get(id=1).detail_changed, repository.modified)
+
+        # the change is kept in the database, not in the cache
+        clear_caches()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -0,0 +1,79 @@
+# -*- coding: UTF-8 -*-
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import override_settings
+
+from haindex import tasks
+from haindex.models import Repository
+from haindex.tests import SimpleCacheTestCase
+
+
+class UpdateRepositoriesTests(SimpleCacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.repository = mock.Mock(id=1)
+        queryset = mock.Mock()
+        queryset.order_by.return_value = [self.repository]
+        patcher = mock.patch.object(Repository, 'objects')
+        patcher.start().filter.return_value = queryset
+        self.addCleanup(patcher.stop)
+
+    def test_push_during_running_update_is_queued_again(self):
+        pending_key = tasks.PENDING_KEY.format(kind='update', id=1)
+        running_key = tasks.RUNNING_KEY.format(id=1)
+        cache.add(running_key, True)
+
+        with mock.patch.object(tasks.update_repositories, 'apply_async') as apply_async:
+            tasks.schedule_repository_updates([1])
+            apply_async.assert_called_once_with([[1]], countdown=settings.UPDATE_DEBOUNCE)
+            apply_async.reset_mock()
+
+            # the debounced task starts while the former update still holds the lock
+            tasks.update_repositories([1])
+            self.repository.update.assert_not_called()
+            apply_async.assert_called_once_with([[1]], countdown=settings.UPDATE_DEBOUNCE)
+            self.assertTrue(cache.get(pending_key))
+
+            # further pushes fold into the queued task
+            apply_async.reset_mock()
+            tasks.schedule_repository_updates([1])
+            apply_async.assert_not_called()
+
+            # the queued task runs once the lock is released
+            cache.delete(running_key)
+            apply_async.reset_mock()
+            tasks.update_repositories([1])
+            self.repository.update.assert_called_once_with()
+            apply_async.assert_not_called()
+            self.assertIsNone(cache.get(pending_key))
+
+
+@override_settings(UPDATE_FAN_OUT_CHUNK_SIZE=2, UPDATE_FAN_OUT_WINDOW=100)
+class FanOutUpdateRepositoryTasksTests(SimpleCacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        repository_ids = mock.Mock()
+        repository_ids.count.return_value = 4
+        repository_ids.iterator.return_value = iter([1, 2, 3, 4])
+        patcher = mock.patch.object(Repository, 'objects')
+        patcher.start().filter.return_value.order_by.return_value.values_list.return_value = repository_ids
+        self.addCleanup(patcher.stop)
+
+    def test_pending_repositories_are_skipped(self):
+        with mock.patch.object(tasks.update_repositories, 'apply_async') as apply_async:
+            # a webhook scheduled an update already
+            tasks.schedule_repository_updates([3])
+            apply_async.reset_mock()
+
+            result = tasks.fan_out_update_repository_tasks()
+
+        self.assertEqual(result, {'chunks': 2, 'repositories': 3})
+        self.assertEqual(apply_async.call_args_list, [
+            mock.call([[1, 2]], countdown=0),
+            mock.call([[4]], countdown=50),
+        ])
+        self.assertTrue(cache.get(tasks.PENDING_KEY.format(kind='update', id=4)))
@@ -0,0 +1,36 @@
+# -*- coding: UTF-8 -*-
+from unittest import mock
+
+from django.test import SimpleTestCase
+from github import RateLimitExceededException
+
+from haindex.common.util.updater import RepositoryUpdater
+from haindex.models import Repository, RepositoryRelease
+
+
+class RepositoryUpdaterRateLimitTests(SimpleTestCase):
+
+    def setUp(self):
+        self.repo = mock.Mock(stargazers_count=1, forks_count=0, open_issues_count=0, pushed_at=None,
+                              default_branch='master')
+        self.repo.owner.type = 'User'
+        self.updater = RepositoryUpdater(repository=Repository(id=1, name='test'))
+        patcher = mock.patch.object(self.updater, '_load_repo', return_value=self.repo)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_exception(self):
+        return RateLimitExceededException(403, {'message': 'API rate limit exceeded'}, {})
+
+    def test_get_branch_raises(self):
+        self.repo.get_branch.side_effect = self.get_exception()
+        with self.assertRaises(RateLimitExceededException):
+            self.updater.update()
+
+    def test_get_releases_raises(self):
+        self.repo.get_releases.side_effect = self.get_exception()
+        with mock.patch.object(RepositoryRelease, 'objects') as objects:
+            objects.filter.return_value.values_list.return_value = []
+            with self.assertRaises(RateLimitExceededException):
+                self.updater._update_releases(self.repo)
+
@@ -19,7 +19,11 @@ urlpatterns = [
     url(r'^$', views.IndexView.as_view(), name='haindex_index'),
     url(r'^extension/submit/$', views.RepositorySubmitView.as_view(), name='haindex_extension_submit'),
     url(r'^extension/search/$', views.RepositorySearchView.as_view(), name='haindex_extension_search'),
+    url(r'^extension/autocomplete/$', views.RepositoryAutocompleteView.as_view(),
+        name='haindex_extension_autocomplete'),
+    url(r'^extension/resolve/$', views.RepositoryResolveView.as_view(), name='haindex_extension_resolve'),
     url(r'^extension/(?P<user>[^/]+)/(?P<name>[^/]+)/$', views.RepositoryDetailView.as_view(),
         name='haindex_extension_detail'),
+    url(r'^api/extensions\.(?P<format>json|ndjson)$', views.CatalogView.as_view(), name='haindex_api_extensions'),
     url(r'^github/callback/$', views.GitHubCallbackView.as_view(), name='haindex_github_callback'),
 ]
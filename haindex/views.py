@@ -1,22 +1,44 @@
 # -*- coding: UTF-8 -*-
 import hmac
 import json
+import logging
+import uuid
+import zlib
+from functools import reduce
 from hashlib import sha1
+from operator import or_
 
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import logout, get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Count
-from django.http import Http404, HttpResponseForbidden, HttpResponse, HttpResponseBadRequest
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Max, Q
+from django.http import Http404, HttpResponseForbidden, HttpResponse, HttpResponseBadRequest, JsonResponse, \
+    HttpResponseRedirect, StreamingHttpResponse
 from django.urls import reverse_lazy, reverse
+from django.utils.decorators import method_decorator
 from django.utils.encoding import force_bytes
 from django.utils.translation import ugettext_lazy as _
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.vary import vary_on_headers
 from django.views.generic import TemplateView, FormView, DetailView, ListView, RedirectView
 from django.views.generic.base import View
+from elasticsearch.exceptions import ElasticsearchException
 
 from haindex import forms, models, documents
+from haindex.common.util.catalog import get_catalog_version, iter_catalog
+from haindex.common.util.counters import get_extension_counts
+from haindex.common.util.detail import get_repository_detail_modified
+from haindex.common.util.pagination import InvalidCursor, LastPushPaginator
+from haindex.common.util.search import search_repositories, get_facet_filters, filter_repositories, \
+    is_elasticsearch_available
+from haindex.common.util.webhook import WebhookProcessor
+
+logger = logging.getLogger(__name__)
 
 
 class IndexView(TemplateView):
@@ -27,12 +49,9 @@ class IndexView(TemplateView):
         ctx['hide_search'] = True
 
         # list extension counts
-        totals = models.Repository.objects.values('type').annotate(total=Count('type'))
-        for total in totals:
-            if total['type'] == models.Repository.TYPE_LOVELACE_ID:
-                ctx['lovelace_count'] = total['total']
-            elif total['type'] == models.Repository.TYPE_COMPONENT_ID:
-                ctx['component_count'] = total['total']
+        counts = get_extension_counts()
+        ctx['lovelace_count'] = counts.get(models.Repository.TYPE_LOVELACE_ID, 0)
+        ctx['component_count'] = counts.get(models.Repository.TYPE_COMPONENT_ID, 0)
 
         return ctx
 
@@ -73,8 +92,8 @@ class RepositorySubmitView(LoginRequiredMixin, FormView):
             user=user, name=form.github_repo)
 
         # start data update job
-        from haindex.tasks import update_repository
-        update_repository.apply_async([repository.id])
+        from haindex.tasks import schedule_repository_update
+        schedule_repository_update(repository.id)
 
         # subscribe to repository events
         if not repository.webhook_id:
@@ -94,23 +113,182 @@ class RepositorySearchView(ListView):
     template_name = 'haindex/repository/search.html'
     context_object_name = 'results'
     paginate_by = 20
+    cursor_kwarg = 'cursor'
 
     def get_context_data(self, *args, **kwargs):
         ctx = super().get_context_data(*args, **kwargs)
         ctx['search_term'] = self.request.GET.get('search', '')
+
+        # keep search term and facets for pagination links
+        params = self.request.GET.copy()
+        params.pop(self.page_kwarg, None)
+        params.pop(self.cursor_kwarg, None)
+        ctx['query_string'] = params.urlencode()
+
+        if self.keyset_page is not None:
+            ctx['result_count'] = self.keyset_count
+            ctx['next_cursor'] = self.keyset_page.next_cursor
+            ctx['previous_cursor'] = self.keyset_page.previous_cursor
+        else:
+            ctx['result_count'] = ctx['paginator'].count
+
+        if hasattr(self.object_list, 'facets'):
+            ctx['facets'] = self.get_facets(self.object_list.facets)
         return ctx
 
+    def get_facets(self, facets):
+        """
+        add links selecting or deselecting facet values
+        """
+        for facet in facets:
+            for bucket in facet['buckets']:
+                params = self.request.GET.copy()
+                params.pop(self.page_kwarg, None)
+                params.pop(self.cursor_kwarg, None)
+                values = params.getlist(facet['name'])
+                if bucket['selected']:
+                    values = [value for value in values if value != bucket['value']]
+                else:
+                    values.append(bucket['value'])
+                params.setlist(facet['name'], values)
+                bucket['url'] = '?' + params.urlencode()
+        return facets
+
+    def get(self, request, *args, **kwargs):
+        # former numbered pages of the listing without search term continue at the same position
+        if not request.GET.get('search') and self.page_kwarg in request.GET:
+            return HttpResponseRedirect(self.get_legacy_page_url())
+        return super().get(request, *args, **kwargs)
+
+    def get_legacy_page_url(self):
+        params = self.request.GET.copy()
+        params.pop(self.page_kwarg)
+        try:
+            cursor = self.get_paginator_by_cursor(get_facet_filters(self.request.GET)).get_cursor_at(
+                (self.get_page_number() - 1) * self.paginate_by)
+        except InvalidCursor:
+            raise Http404(_('Invalid page'))
+        if cursor:
+            params[self.cursor_kwarg] = cursor
+        return '{path}?{params}'.format(path=self.request.path, params=params.urlencode())
+
+    def get_paginator_by_cursor(self, filters):
+        queryset = models.Repository.objects.annotate(username=F('user__username')).defer('readme', 'search_vector')
+        return LastPushPaginator(filter_repositories(queryset, filters), page_size=self.paginate_by)
+
+    def get_page_number(self):
+        try:
+            return int(self.request.GET.get(self.page_kwarg) or 1)
+        except ValueError:
+            return 1
+
+    def get_paginate_by(self, queryset):
+        # the listing without search term is paginated by cursor
+        if self.keyset_page is not None:
+            return None
+        return super().get_paginate_by(queryset)
+
     def get_queryset(self):
+        filters = get_facet_filters(self.request.GET)
+        self.keyset_page = None
+
         # filter search
         search_term = self.request.GET.get('search', None)
         if search_term:
-            queryset = documents.RepositoryDocument.search_all(term=search_term).to_queryset()
-        else:
-            queryset = models.Repository.objects.all().order_by('-last_push')
-
-        return queryset
-
+            # render results from the search hits directly
+            return search_repositories(term=search_term, page=self.get_page_number(), page_size=self.paginate_by,
+                                       filters=filters)
 
+        paginator = self.get_paginator_by_cursor(filters)
+        try:
+            self.keyset_page = paginator.get_page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404(_('Invalid page'))
+        self.keyset_count = paginator.count(key=json.dumps(filters, sort_keys=True))
+        return self.keyset_page.object_list
+
+
+@method_decorator(cache_control(public=True, max_age=settings.AUTOCOMPLETE_MAX_AGE), name='dispatch')
+class RepositoryAutocompleteView(View):
+    """
+    suggest extensions by name, owner or keyword prefix
+    """
+
+    def get(self, request, *args, **kwargs):
+        prefix = request.GET.get('q', '').strip()[:100]
+        if not prefix:
+            return JsonResponse({'results': []})
+
+        if is_elasticsearch_available():
+            try:
+                return JsonResponse({'results': self.get_suggestions(prefix)})
+            except ElasticsearchException as e:
+                logger.warning('Autocomplete falls back to the database: %s', e)
+        return JsonResponse({'results': self.get_database_suggestions(prefix)})
+
+    def get_suggestions(self, prefix):
+        response = documents.RepositoryDocument.suggest_all(prefix, size=settings.AUTOCOMPLETE_SIZE).execute()
+        return [
+            self.get_result(option.text, option._source.username, option._source.name, option._source.type)
+            for option in response.suggest.extensions[0].options
+        ]
+
+    def get_database_suggestions(self, prefix):
+        repositories = models.Repository.objects.filter(
+            Q(name__istartswith=prefix) | Q(user__username__istartswith=prefix)).order_by(
+            F('stargazers_count').desc(nulls_last=True), 'id').values_list(
+            'user__username', 'name', 'type')[:settings.AUTOCOMPLETE_SIZE]
+        return [
+            self.get_result(name if name.lower().startswith(prefix.lower()) else username, username, name,
+                            documents.RepositoryDocument.TYPE_NAMES.get(type_id))
+            for username, name, type_id in repositories
+        ]
+
+    def get_result(self, text, username, name, type):
+        return {
+            'text': text,
+            'name': '{}/{}'.format(username, name),
+            'type': type,
+            'url': reverse('haindex_extension_detail', kwargs=dict(user=username, name=name)),
+        }
+
+
+def get_repository_detail_state(request, user, name):
+    """
+    get the id and the last change of a repository detail page, once per request
+    """
+    if not hasattr(request, '_repository_detail_state'):
+        state = models.Repository.objects.filter(user__username=user, name=name).values(
+            'id', 'modified', 'last_import', 'detail_changed').first()
+        if state is not None:
+            state['changed'] = get_repository_detail_modified(
+                state['modified'], state['last_import'], state['detail_changed'])
+        request._repository_detail_state = state
+    return request._repository_detail_state
+
+
+def get_repository_detail_etag(request, user, name):
+    state = get_repository_detail_state(request, user, name)
+    if state is None:
+        return None
+
+    # the page contains the login state and flash messages
+    value = '{id}:{changed}:{user}:{messages}'.format(
+        id=state['id'], changed=state['changed'].isoformat() if state['changed'] else '',
+        user=request.user.pk or '', messages=len(messages.get_messages(request)))
+    return sha1(force_bytes(value)).hexdigest()
+
+
+def get_repository_detail_last_modified(request, user, name):
+    # the timestamp doesn't reflect the login state and messages, etags are used for those requests
+    if request.user.is_authenticated or len(messages.get_messages(request)):
+        return None
+    state = get_repository_detail_state(request, user, name)
+    return state['changed'] if state is not None else None
+
+
+@method_decorator(condition(etag_func=get_repository_detail_etag,
+                            last_modified_func=get_repository_detail_last_modified), name='dispatch')
 class RepositoryDetailView(DetailView):
     template_name = 'haindex/repository/detail.html'
     model = models.Repository
@@ -120,9 +298,10 @@ class RepositoryDetailView(DetailView):
         if queryset is None:
             queryset = self.get_queryset()
 
+        # the readme is only loaded if the cached fragment is missing
         queryset = queryset.filter(
             user__username=self.kwargs.get('user'), name=self.kwargs.get('name')
-        ).prefetch_related('dependencies', 'repositoryrelease_set')
+        ).select_related('user', 'parent_repository__user').defer('readme', 'search_vector')
 
         try:
             # Get the single item from the filtered queryset
@@ -131,8 +310,157 @@ class RepositoryDetailView(DetailView):
             raise Http404(_('Repository not found, why don\'t you add it to the index?'))
         return obj
 
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        state = get_repository_detail_state(self.request, self.kwargs.get('user'), self.kwargs.get('name'))
+
+        # cached fragments are keyed by the last change of the page
+        ctx['detail_version'] = state['changed'].isoformat() if state and state['changed'] else ''
+        ctx['detail_cache_timeout'] = settings.DETAIL_CACHE_TIMEOUT
+
+        # lazy querysets, only evaluated when a fragment is rendered
+        ctx['forks'] = self.object.repository_set.select_related('user').order_by('-last_push')
+        ctx['releases'] = self.object.repositoryrelease_set.all()[:5]
+        ctx['dependencies'] = self.object.dependencies.select_related('user').order_by('user__username', 'name')
+        ctx['providers'] = self.object.provider.select_related('user').order_by('user__username', 'name')
+        return ctx
+
+
+class RepositoryResolveView(View):
+    """
+    list the extensions to install for the requested extensions, dependencies first
+    """
+
+    def get(self, request, *args, **kwargs):
+        keys = []
+        for value in request.GET.getlist('extension'):
+            key = tuple(value.strip('/').split('/'))
+            if len(key) == 2 and all(key):
+                keys.append(key)
+        if not keys:
+            return HttpResponseBadRequest('Please provide at least one extension as user/name')
+
+        # get requested extensions
+        roots = {
+            (root['user__username'], root['name']): root
+            for root in models.Repository.objects.filter(
+                reduce(or_, [Q(user__username=username, name=name) for username, name in keys])).values(
+                'id', 'user__username', 'name', 'has_dependency_cycle')
+        }
+
+        # get all transitive dependencies in a single query, longest dependency path first
+        dependencies = models.RepositoryDependencyPath.objects.filter(
+            ancestor_id__in=[root['id'] for root in roots.values()]).values(
+            'descendant_id', 'descendant__user__username', 'descendant__name').annotate(
+            depth=Max('depth')).order_by('-depth', 'descendant__user__username', 'descendant__name')
+
+        extensions = [
+            self._get_extension(dependency['descendant__user__username'], dependency['descendant__name'],
+                                dependency['depth'])
+            for dependency in dependencies
+        ]
+        dependency_ids = {dependency['descendant_id'] for dependency in dependencies}
+        extensions += [
+            self._get_extension(username, name, 0)
+            for username, name in sorted(roots.keys()) if roots[(username, name)]['id'] not in dependency_ids
+        ]
+
+        return JsonResponse({
+            'extensions': extensions,
+            'missing': ['{}/{}'.format(username, name) for username, name in keys if (username, name) not in roots],
+            'cycles': ['{}/{}'.format(username, name) for (username, name), root in sorted(roots.items())
+                       if root['has_dependency_cycle']],
+        })
+
+    def _get_extension(self, username, name, depth):
+        return {
+            'name': '{}/{}'.format(username, name),
+            'url': self.request.build_absolute_uri(
+                reverse('haindex_extension_detail', kwargs=dict(user=username, name=name))),
+            'depth': depth,
+        }
+
+
+def get_catalog_etag(request, format):
+    # strong etag, the compressed representation is a different one
+    return '{version}-{format}-{encoding}'.format(
+        version=get_catalog_version(), format=format, encoding='gzip' if accepts_gzip(request) else 'identity')
+
+
+def accepts_gzip(request):
+    """
+    whether the client accepts gzip, codings refused with q=0 don't count
+    """
+    for coding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, *params = [part.strip() for part in coding.split(';')]
+        if name.lower() != 'gzip':
+            continue
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+# not modified responses need the caching headers as well, condition() has to be the innermost decorator
+@method_decorator(cache_control(public=True, max_age=settings.CATALOG_MAX_AGE), name='dispatch')
+@method_decorator(vary_on_headers('Accept-Encoding'), name='dispatch')
+@method_decorator(condition(etag_func=get_catalog_etag), name='dispatch')
+class CatalogView(View):
+    """
+    stream all indexed extensions as json or newline delimited json
+    """
+    CONTENT_TYPES = {
+        'json': 'application/json',
+        'ndjson': 'application/x-ndjson',
+    }
+
+    def get(self, request, format, *args, **kwargs):
+        if format == 'ndjson':
+            content = self.get_ndjson()
+        else:
+            content = self.get_json()
+
+        gzip = accepts_gzip(request)
+        response = StreamingHttpResponse(self.compress(content) if gzip else content,
+                                         content_type=self.CONTENT_TYPES[format])
+        if gzip:
+            response['Content-Encoding'] = 'gzip'
+        return response
+
+    def get_ndjson(self):
+        for extension in iter_catalog():
+            yield json.dumps(extension, cls=DjangoJSONEncoder) + '\n'
+
+    def get_json(self):
+        yield '['
+        for index, extension in enumerate(iter_catalog()):
+            yield (',\n' if index else '\n') + json.dumps(extension, cls=DjangoJSONEncoder)
+        yield '\n]\n'
+
+    def compress(self, content):
+        # collect small chunks to compress efficiently
+        compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        buffer = []
+        size = 0
+        for chunk in content:
+            buffer.append(chunk.encode('utf-8'))
+            size += len(buffer[-1])
+            if size >= 64 * 1024:
+                data = compressor.compress(b''.join(buffer))
+                buffer, size = [], 0
+                if data:
+                    yield data
+        yield compressor.compress(b''.join(buffer)) + compressor.flush()
+
 
 class GitHubCallbackView(View):
+    PROCESSING_SCHEDULED_KEY = 'haindex:webhook:processing:scheduled'
+
     @csrf_exempt
     def dispatch(self, request, *args, **kwargs):
         # get request signature
@@ -156,35 +484,26 @@ class GitHubCallbackView(View):
 
     def post(self, request, *args, **kwargs):
         event = request.META.get('HTTP_X_GITHUB_EVENT', 'ping')
+        if event not in WebhookProcessor.UPDATE_EVENTS + WebhookProcessor.STATS_EVENTS + WebhookProcessor.FORK_EVENTS:
+            return HttpResponse(status=204)
 
         # get payload from post data or use whole request body
         if 'payload' in request.POST:
-            payload = json.loads(request.POST['payload'])
-        else:
-            payload = json.loads(request.body.decode('utf-8'))
-
-        # get related repository
-        repository = models.Repository.objects.filter(
-            user__name=payload['repository']['owner']['login'],
-            name=payload['repository']['name']).first()
-        if not repository:
-            return HttpResponse(status=204)
-
-        # handle the event
-        if event == 'push':
-            from haindex.tasks import update_repository
-            update_repository.apply_async([repository.id])
-        elif event in ('watch', 'issues', 'pull_request'):
-            from haindex.tasks import update_repository_stats
-            update_repository_stats.apply_async([repository.id])
-        elif event == 'fork':
-            fork_user, created = get_user_model().objects.get_or_create(
-                username=payload['forkee']['owner']['login'])
-            fork_repository, created = models.Repository.objects.get_or_create(
-                user=fork_user, name=payload['forkee']['name'])
-            from haindex.tasks import update_repository
-            update_repository.apply_async([fork_repository.id])
+            payload = request.POST['payload']
         else:
-            return HttpResponse(status=204)
+            payload = request.body.decode('utf-8')
+
+        # store the delivery, redeliveries of the same event are ignored
+        delivery_id = request.META.get('HTTP_X_GITHUB_DELIVERY') or uuid.uuid4().hex
+        models.WebhookDelivery.objects.get_or_create(
+            delivery_id=delivery_id, defaults=dict(event=event, payload=payload))
+
+        # process the inbox soon, the periodic task picks it up if the broker is unavailable
+        if cache.add(self.PROCESSING_SCHEDULED_KEY, True, timeout=settings.WEBHOOK_BATCH_DELAY):
+            try:
+                from haindex.tasks import process_webhook_deliveries
+                process_webhook_deliveries.apply_async(countdown=settings.WEBHOOK_BATCH_DELAY)
+            except Exception as e:
+                logger.exception(e)
 
         return HttpResponse('success')